@@ -0,0 +1,73 @@
+"""
+Peak Python memory and wall time of `jot ID --attach` and `jot ID --extract`
+as attachment size grows, and the summary view's time with them stored
+
+    python benchmarks/bench_attach.py
+"""
+
+import io
+import os
+import time
+import tempfile
+import tracemalloc
+import contextlib
+
+from pathlib import Path
+
+from common import make_db, make_jot
+
+
+def timed(fn):
+    # (seconds, peak traced bytes) of fn()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def summary_seconds(jot):
+    # one summary view; flat as attachments grow because it never reads Files
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        jot.print_notes(mode='nested', status_show=(1, 2, 5))
+    return time.perf_counter() - start
+
+
+def main(sizes_mb=(1, 16, 256)):
+    print('MB'.rjust(6) + 'attach s'.rjust(10) + 'peak MB'.rjust(9) + 'extract s'.rjust(11) + 'peak MB'.rjust(9)
+            + 'db MB'.rjust(8) + 'summary s'.rjust(11))
+    for mb in sizes_mb:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            db = tmp / 'bench.sqlite'
+            make_db(db, 1000)
+            jot = make_jot(db)
+            src = tmp / 'payload.bin'
+            with open(src, 'wb') as f:
+                for _ in range(mb):
+                    f.write(os.urandom(1 << 20))
+            (tmp / 'out').mkdir()
+
+            def attach():
+                with jot.transaction():
+                    jot.attach_files([1, 2, 3], [src])
+
+            def extract():
+                jot.extract_files([1], tmp / 'out')
+
+            attach_s, attach_peak = timed(attach)
+            extract_s, extract_peak = timed(extract)
+            summary_s = summary_seconds(jot)
+            jot.conn.close()
+            db_mb = db.stat().st_size / 2**20
+        print(str(mb).rjust(6) + '{:10.3f}'.format(attach_s) + '{:9.1f}'.format(attach_peak / 2**20)
+                + '{:11.3f}'.format(extract_s) + '{:9.1f}'.format(extract_peak / 2**20)
+                + '{:8.1f}'.format(db_mb) + '{:11.3f}'.format(summary_s))
+
+
+if __name__ == '__main__':
+    main()
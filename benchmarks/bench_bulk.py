@@ -0,0 +1,38 @@
+"""
+Wall time of bulk status changes (`jot 1 2 ... -s 3`) and removals (`jot ... -rm`)
+
+    python benchmarks/bench_bulk.py
+"""
+
+import io
+import time
+import tempfile
+import contextlib
+
+from pathlib import Path
+
+from common import make_db, make_jot
+
+
+def main(sizes=(100, 1000, 10000)):
+    print('ids'.rjust(8) + 'edit s'.rjust(10) + 'remove s'.rjust(10))
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Path(tmp) / 'bench.sqlite'
+            make_db(db, n)
+            jot = make_jot(db)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                with jot.transaction():
+                    jot.input_note(None, 3, None, None, None, jot.identifier_to_id(range(1, n + 1)), None)
+                edit = time.perf_counter() - start
+                start = time.perf_counter()
+                with jot.transaction():
+                    jot.remove_notes(jot.identifier_to_id(range(1, n + 1)))
+                remove = time.perf_counter() - start
+            jot.conn.close()
+        print(str(n).rjust(8) + '{:10.3f}'.format(edit) + '{:10.3f}'.format(remove))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Write throughput and read latency under a concurrent writer, with sqlite's
+stock settings versus jot's configured pragmas (Jot.PRAGMA_DEFAULTS), then
+how long a read-then-write command waits on another process's write
+
+    python benchmarks/bench_pragmas.py
+"""
+
+import io
+import time
+import sqlite3
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+
+from pathlib import Path
+
+from common import Jot, make_db, make_jot
+
+STOCK = {'busy_timeout': '5000', 'journal_mode': 'DELETE', 'synchronous': 'FULL', 'cache_size': '', 'mmap_size': ''}
+
+
+def write_throughput(jot, commits=300):
+    # one small transaction per "command", like repeated `jot -n ...`
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(commits):
+            with jot.transaction():
+                jot.add_note('note ' + str(i), 2, None, None, None, None, False)
+    return commits / (time.perf_counter() - start)
+
+
+def read_latency(db, pragmas, seconds=2.0):
+    # worst and mean summary-query time while another connection keeps committing
+    reader = make_jot(db, pragmas)
+    stop = threading.Event()
+
+    def write():
+        writer = make_jot(db, pragmas) # connections stay on the thread that opened them
+        with contextlib.redirect_stdout(io.StringIO()):
+            while not stop.is_set():
+                with writer.transaction():
+                    for i in range(200):
+                        writer.add_note('concurrent ' + str(i), 2, None, None, None, None, False)
+        writer.conn.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            reader.cursor.execute('SELECT count(*) FROM Notes WHERE status_id IN (1, 2, 5)').fetchone()
+        except sqlite3.OperationalError: # locked past busy_timeout
+            pass
+        latencies.append(time.perf_counter() - start)
+    stop.set()
+    thread.join()
+    reader.conn.close()
+    return max(latencies), sum(latencies) / len(latencies)
+
+
+def hold_write(db, pragmas, ready, hold, errors):
+    # another process mid-command: it has read, holds the write lock for `hold` seconds, then writes
+    jot = make_jot(db, pragmas)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), jot.transaction():
+            jot.cursor.execute('SELECT count(*) FROM Notes').fetchone()
+            ready.set()
+            time.sleep(hold)
+            jot.add_note('holder', 2, None, None, None, None, False)
+    except sqlite3.OperationalError as e:
+        errors.put('the other process ' + str(e))
+    jot.conn.close()
+
+
+def lock_wait(db, pragmas, hold=0.5):
+    # (seconds this process's read-then-write waited, error or None) while another process holds the lock
+    ready = multiprocessing.Event()
+    errors = multiprocessing.Queue()
+    holder = multiprocessing.Process(target=hold_write, args=(db, pragmas, ready, hold, errors))
+    holder.start()
+    ready.wait()
+    jot = make_jot(db, pragmas)
+    start = time.perf_counter()
+    error = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), jot.transaction():
+            jot.identifier_to_id(['1'])
+            jot.add_note('waiter', 2, None, None, None, None, False)
+    except sqlite3.OperationalError as e:
+        error = str(e)
+    waited = time.perf_counter() - start
+    holder.join()
+    if error is None and not errors.empty():
+        error = errors.get()
+    jot.conn.close()
+    return waited, error
+
+
+def main():
+    print('settings'.ljust(12) + 'commits/s'.rjust(12) + 'read max ms'.rjust(14) + 'read mean ms'.rjust(14))
+    for label, pragmas in (('stock', STOCK), ('configured', Jot.PRAGMA_DEFAULTS)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Path(tmp) / 'bench.sqlite'
+            make_db(db, 10000)
+            jot = make_jot(db, pragmas)
+            throughput = write_throughput(jot)
+            jot.conn.close()
+            worst, mean = read_latency(db, pragmas)
+        print(label.ljust(12) + '{0:12.0f}{1:14.2f}{2:14.3f}'.format(throughput, worst * 1000, mean * 1000))
+    print()
+    print('read-then-write while another process holds the write lock for 500 ms')
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / 'bench.sqlite'
+        make_db(db, 1000)
+        waited, error = lock_wait(db, Jot.PRAGMA_DEFAULTS)
+    # busy_timeout only helps if the wait happens at BEGIN: this should wait about 500 ms, then write
+    print('{0:.0f} ms, '.format(waited * 1000) + ('failed: ' + error if error else 'waited, then both wrote'))
+
+
+if __name__ == '__main__':
+    main()
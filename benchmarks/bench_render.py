@@ -0,0 +1,51 @@
+"""
+Time to render summary table rows (`jot -o flat`) without touching the database
+
+    python benchmarks/bench_render.py
+"""
+
+import os
+import time
+import random
+import tempfile
+import contextlib
+
+from pathlib import Path
+
+from common import make_db, make_jot
+
+
+def fake_rows(n, seed=0):
+    # rows shaped like Jot.ROW_COLUMNS: Notes then Status
+    rng = random.Random(seed)
+    statuses = ['o=o', '[ ]', '[x]', '[0]', '[\\]']
+    rows = {}
+    for i in range(1, n + 1):
+        status_id = rng.randint(1, 5)
+        description = ' '.join('word' + str(rng.randint(0, 999)) for _ in range(rng.randint(1, 20)))
+        if rng.random() < 0.2:
+            description += '\nsecond line'
+        rows[i] = (i, status_id, '2026-01-01' if rng.random() < 0.3 else None, description,
+                '2026-01-01 00:00:00', '2026-01-01 00:00:00', None, None, status_id, statuses[status_id - 1])
+    return rows
+
+
+def main(n=100000, repeat=5):
+    rows = fake_rows(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / 'bench.sqlite'
+        make_db(db, 0)
+        jot = make_jot(db)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                jot.print_flat(list(rows), None, False, rows)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        jot.conn.close()
+    print('rendered {0} rows in {1:.3f} s ({2:.2f} us/row)'.format(n, best, best / n * 1e6))
+
+
+if __name__ == '__main__':
+    main()
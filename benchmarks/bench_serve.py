@@ -0,0 +1,72 @@
+"""
+Latency of bare `jot` run directly versus forwarded to a warm `jot --serve`:
+the socket round trip alone (in process) and whole invocations
+
+    python benchmarks/bench_serve.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import statistics
+
+from pathlib import Path
+
+from common import ROOT, make_db
+
+JOT = [sys.executable, '-c', 'import jot.jot as j; j.main()']
+
+
+def wall_times(env, runs=20):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(JOT, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def round_trips(home, runs=200):
+    # forward() in this process, so interpreter startup is left out
+    code = '''
+import io, sys, time, contextlib
+import jot.jot as j
+times = []
+for _ in range({0:d}):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert j.forward([])
+    times.append(time.perf_counter() - start)
+print(' '.join(map(str, times)))
+'''.format(runs)
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return [float(i) for i in result.stdout.split()]
+
+
+def main(n_notes=2000):
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        (Path(home) / '.jot').mkdir()
+        make_db(Path(home) / '.jot' / 'jot.sqlite', n_notes)
+        subprocess.run(JOT, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True) # writes config
+        direct = wall_times(env)
+        server = subprocess.Popen(JOT + ['--serve'], cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+        try:
+            sock = Path(home) / '.jot' / 'jot.sock'
+            while not sock.exists():
+                time.sleep(0.01)
+            served = wall_times(env)
+            trips = round_trips(home)
+        finally:
+            server.terminate()
+            server.wait()
+    print('bare jot, {0:d} notes (median / min ms)'.format(n_notes))
+    for label, times in (('direct', direct), ('via --serve', served), ('socket round trip', trips)):
+        print('{0:20s}{1:8.1f}{2:8.1f}'.format(label, statistics.median(times) * 1000, min(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Cold-start cost of bare `jot`: module import time (python -X importtime)
+and wall-clock time of whole invocations against a small database
+
+    python benchmarks/bench_startup.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import statistics
+
+from common import ROOT
+
+JOT = [sys.executable, '-c', 'import jot.jot as j; j.main()']
+
+
+def import_times(top=8):
+    # (cumulative us, module) for the slowest imports under `import jot.jot`
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import jot.jot'],
+            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            if cumulative_us.strip().isdigit():
+                times.append((int(cumulative_us), module.strip()))
+    times.sort(reverse=True)
+    return times[:top]
+
+
+def wall_times(runs=20):
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        for _ in range(2): # first runs write config and create the database
+            subprocess.run(JOT, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(JOT, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    print('slowest imports (cumulative ms):')
+    for us, module in import_times():
+        print('{0:10.1f}  {1}'.format(us / 1000, module))
+    times = wall_times()
+    print('bare jot: median {0:.1f} ms, min {1:.1f} ms over {2} runs'.format(
+            statistics.median(times) * 1000, min(times) * 1000, len(times)))
+
+
+if __name__ == '__main__':
+    main()
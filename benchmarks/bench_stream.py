@@ -0,0 +1,55 @@
+"""
+Time to the first screen of the summary (`jot -l`, `jot --limit 50`) and peak
+Python memory of streaming the whole table, as note count grows
+
+    python benchmarks/bench_stream.py
+"""
+
+import time
+import tempfile
+import itertools
+import tracemalloc
+
+from pathlib import Path
+
+from common import make_db, make_jot
+
+
+def main(sizes=(1000, 10000, 100000, 250000), screen=50):
+    print('notes'.rjust(8) + 'mode'.rjust(8) + 'first screen s'.rjust(16) + 'limit page s'.rjust(14)
+            + 'all rows s'.rjust(12) + 'peak MB'.rjust(9))
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Path(tmp) / 'bench.sqlite'
+            make_db(db, n)
+            jot = make_jot(db)
+            for mode in ('nested', 'flat'):
+                jot.tree = None
+                start = time.perf_counter()
+                list(itertools.islice(jot.summary_lines(mode, (1, 2, 5)), screen))
+                first = time.perf_counter() - start
+
+                jot.tree = None
+                start = time.perf_counter()
+                list(jot.summary_lines(mode, (1, 2, 5), limit=screen, after=n // 2))
+                page = time.perf_counter() - start
+
+                jot.tree = None
+                start = time.perf_counter()
+                for line in jot.summary_lines(mode, (1, 2, 5)):
+                    pass
+                whole = time.perf_counter() - start
+
+                jot.tree = None
+                tracemalloc.start()
+                for line in jot.summary_lines(mode, (1, 2, 5)):
+                    pass
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(str(n).rjust(8) + mode.rjust(8) + '{:16.4f}'.format(first) + '{:14.4f}'.format(page)
+                        + '{:12.3f}'.format(whole) + '{:9.1f}'.format(peak / 2**20))
+            jot.conn.close()
+
+
+if __name__ == '__main__':
+    main()
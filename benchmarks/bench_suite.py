@@ -0,0 +1,222 @@
+"""
+Times the core code paths on seeded synthetic databases and writes JSON
+results that a later run can be compared against
+
+    python benchmarks/bench_suite.py --notes 1000,10000 --json before.json
+    python benchmarks/bench_suite.py --notes 1000,10000 --compare before.json
+
+The same arguments always build the same databases, so two runs differ only
+in the code under test.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import tempfile
+import argparse
+import platform
+import subprocess
+import contextlib
+import statistics
+
+from pathlib import Path
+
+from common import ROOT, generate_db, make_jot
+
+JOT = [sys.executable, '-c', 'import jot.jot as j; j.main()']
+
+
+def measure(fn, repeat, setup=None, teardown=None):
+    # wall times of fn(), each between its own setup and teardown
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if teardown:
+            teardown()
+    return times
+
+
+def quiet(fn):
+    # fn with its printed output thrown away
+    def run():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            fn()
+    return run
+
+
+def operations(jot, rng):
+    # (name, fn, setup, teardown); writes run in a transaction that is rolled back afterwards
+    active = [i[0] for i in jot.conn.execute('SELECT notes_id FROM Notes WHERE status_id IN (1, 2, 5)')]
+    aliases = [i[0] for i in jot.conn.execute('SELECT alias FROM Notes WHERE alias IS NOT NULL')]
+    n = jot.conn.execute('SELECT count(*) FROM Notes').fetchone()[0]
+    identifiers = [str(i) for i in rng.sample(range(1, n + 1), min(1000, n))] + rng.sample(aliases, min(200, len(aliases)))
+    sql_parents = 'SELECT DISTINCT parent FROM Nest WHERE parent IN (SELECT child FROM Nest) ORDER BY parent'
+    inner = [i[0] for i in jot.conn.execute(sql_parents)]
+    to_remove = sorted(rng.sample(inner, min(100, len(inner))))
+    to_edit = sorted(rng.sample(range(1, n + 1), min(5000, n)))
+    sql_roots = 'SELECT DISTINCT parent FROM Nest WHERE parent NOT IN (SELECT child FROM Nest) ORDER BY parent'
+    roots = [i[0] for i in jot.conn.execute(sql_roots)] or [1]
+    sql_leaves = 'SELECT DISTINCT child FROM Nest WHERE child NOT IN (SELECT parent FROM Nest) ORDER BY child'
+    leaves = [i[0] for i in jot.conn.execute(sql_leaves)] or [1]
+    some_roots = sorted(rng.sample(roots, min(20, len(roots))))
+    some_leaves = sorted(rng.sample(leaves, min(20, len(leaves))))
+
+    def cold_tree():
+        jot.tree = None
+
+    def begin():
+        jot.tree = None
+        jot.cursor.execute('BEGIN')
+
+    def rollback():
+        jot.conn.rollback()
+        jot.tree = None
+
+    return [
+        ('print_notes nested', quiet(lambda: jot.print_notes(mode='nested', status_show=(1, 2, 5))), cold_tree, None),
+        ('print_notes flat', quiet(lambda: jot.print_notes(mode='flat', status_show=(1, 2, 5))), None, None),
+        ('print_notes -v', quiet(lambda: jot.print_notes(mode='nested', full=True)), cold_tree, None),
+        ('nest_notes', lambda: jot.nest_notes(active), cold_tree, None),
+        ('search_notes word', lambda: jot.search_notes('w1'), None, None),
+        ('search_notes phrase', lambda: jot.search_notes('"w0 w1" w2'), None, None),
+        ('print_notes --find', quiet(lambda: jot.print_notes(mode='nested', status_show=(1, 2, 5), find='w3')), cold_tree, None),
+        ('print_notes --find OR NOT', quiet(lambda: jot.print_notes(mode='flat', status_show=(1, 2, 5), find='(w3 OR w4) NOT w5')), None, None),
+        ('print_notes --regex', quiet(lambda: jot.print_notes(mode='flat', status_show=(1, 2, 5), regex=r'w1\d\b')), None, None),
+        ('print_notes --agenda', quiet(lambda: jot.print_notes(status_show=(1, 2, 5), due=jot.due_range(7))), None, None),
+        ('print_notes --overdue', quiet(lambda: jot.print_notes(status_show=(1, 2, 5), due=jot.due_range(None, True), limit=50)), None, None),
+        ('print_notes --sort', quiet(lambda: jot.print_notes(status_show=(1, 2, 5), sort='priority', limit=50)), None, None),
+        ('print_relatives subtree', quiet(lambda: jot.print_relatives(some_roots)), None, None),
+        ('print_relatives ancestors', quiet(lambda: jot.print_relatives(some_leaves, ancestors=True)), None, None),
+        ('identifier_to_id', lambda: jot.identifier_to_id(identifiers), None, None),
+        ('identifier_to_id range', lambda: jot.identifier_to_id(['1-' + str(n)]), None, None),
+        ('identifier_to_id glob', lambda: jot.identifier_to_id(['a*', '*z']), None, None),
+        ('remove_notes reparent', quiet(lambda: jot.remove_notes(to_remove)), begin, rollback),
+        ('add_many', lambda: jot.add_many({'description': 'added ' + str(i), 'parents': [roots[0]]} for i in range(1000)), begin, rollback),
+        ('changes_since 0', lambda: sum(1 for record in jot.changes_since(0)), None, None),
+        ('edit_notes bulk', quiet(lambda: jot.edit_notes(None, 3, None, None, None, to_edit, None, False)), begin, rollback),
+    ]
+
+
+def cold_start(home, repeat):
+    # whole `jot` invocations on ~/.jot/jot.sqlite: interpreter start, config, connect and the default summary
+    env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+    def run():
+        subprocess.run(JOT, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+    run() # writes config
+    return measure(run, repeat)
+
+
+def run_suite(args):
+    results = []
+    shapes = []
+    for n in args.notes:
+        with tempfile.TemporaryDirectory() as home:
+            (Path(home) / '.jot').mkdir()
+            db = Path(home) / '.jot' / 'jot.sqlite'
+            shape = generate_db(db, n, seed=args.seed, nested=args.nested, depth=args.depth, fanout=args.fanout,
+                    cycles=args.cycles, alias_density=args.alias_density, desc_words=args.desc_words,
+                    desc_sigma=args.desc_sigma, multiline=args.multiline)
+            shapes.append(shape)
+            jot = make_jot(db)
+            for name, fn, setup, teardown in operations(jot, random.Random(args.seed)):
+                if args.only and not any(i in name for i in args.only):
+                    continue
+                results.append(result(n, name, measure(fn, args.repeat, setup, teardown)))
+                report(results[-1])
+            jot.conn.close()
+            if not args.only or any(i in 'cold start' for i in args.only):
+                results.append(result(n, 'cold start', cold_start(home, args.repeat)))
+                report(results[-1])
+    return {'meta': meta(args, shapes), 'results': results}
+
+
+def result(n, name, times):
+    return {'notes': n, 'op': name, 'median': statistics.median(times), 'min': min(times), 'runs': times}
+
+
+def report(r):
+    print(str(r['notes']).rjust(8) + '  ' + r['op'].ljust(28) + '{:10.4f}'.format(r['median'])
+            + '{:10.4f}'.format(r['min']))
+
+
+def meta(args, shapes):
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        revision = None
+    params = {k: v for k, v in vars(args).items() if k not in ('json', 'compare', 'only', 'threshold')}
+    return {'revision': revision, 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'params': params, 'shapes': shapes}
+
+
+def compare(current, path, threshold):
+    # median ratio against an earlier run for every (notes, op) both have
+    with open(path) as f:
+        before = json.load(f)
+    shape = lambda params: {k: v for k, v in params.items() if k not in ('notes', 'repeat')}
+    if shape(before['meta']['params']) != shape(current['meta']['params']):
+        print('note: ' + path + ' was run on differently shaped databases')
+    old = {(r['notes'], r['op']): r for r in before['results']}
+    print('\nagainst ' + path + ' (' + str(before['meta'].get('revision')) + ')')
+    print('notes'.rjust(8) + '  ' + 'op'.ljust(28) + 'before'.rjust(10) + 'now'.rjust(10) + 'ratio'.rjust(8))
+    slower = 0
+    for r in current['results']:
+        key = (r['notes'], r['op'])
+        if key not in old:
+            continue
+        ratio = r['median'] / old[key]['median'] if old[key]['median'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  slower'
+            slower += 1
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(str(r['notes']).rjust(8) + '  ' + r['op'].ljust(28) + '{:10.4f}'.format(old[key]['median'])
+                + '{:10.4f}'.format(r['median']) + '{:8.2f}'.format(ratio) + flag)
+    return slower
+
+
+def parse_args(argv=None):
+    sizes = lambda s: [int(i) for i in s.split(',')]
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--notes', type=sizes, default=[1000, 10000, 100000], help='comma separated database sizes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--nested', type=float, default=0.3, help='fraction of notes in trees')
+    parser.add_argument('--depth', type=int, default=3, help='levels below each root')
+    parser.add_argument('--fanout', type=int, default=4, help='most children per parent')
+    parser.add_argument('--cycles', type=int, default=5, help='trees with a leaf linked back to the root')
+    parser.add_argument('--alias-density', type=float, default=0.05, help='fraction of notes with an alias')
+    parser.add_argument('--desc-words', type=float, default=12, help='median words per description')
+    parser.add_argument('--desc-sigma', type=float, default=1.0, help='spread of the lognormal word count')
+    parser.add_argument('--multiline', type=float, default=0.2, help='fraction of multiline descriptions')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per operation')
+    parser.add_argument('--only', type=lambda s: s.split(','), help='comma separated substrings of the ops to run')
+    parser.add_argument('--json', metavar='FILE', help='write the results here')
+    parser.add_argument('--compare', metavar='FILE', help='compare with the results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='ratio change flagged by --compare')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print('notes'.rjust(8) + '  ' + 'op'.ljust(28) + 'median s'.rjust(10) + 'min s'.rjust(10))
+    current = run_suite(args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(current, f, indent=1)
+    if args.compare:
+        return 1 if compare(current, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Query count and wall time of the summary view (`jot`) as note count grows
+
+    python benchmarks/bench_summary.py
+"""
+
+import io
+import time
+import tempfile
+import contextlib
+
+from pathlib import Path
+
+from common import make_db, make_jot, count_queries
+
+
+def main(sizes=(100, 1000, 10000, 50000)):
+    print('notes'.rjust(8) + 'row queries'.rjust(14) + 'all queries'.rjust(14) + 'seconds'.rjust(10))
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Path(tmp) / 'bench.sqlite'
+            make_db(db, n)
+            jot = make_jot(db)
+            statements = count_queries(jot.conn)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                jot.print_notes(mode='nested', status_show=(1, 2, 5))
+            elapsed = time.perf_counter() - start
+            jot.conn.close()
+        row_queries = [s for s in statements if 'FROM Notes LEFT JOIN Status' in s]
+        print(str(n).rjust(8) + str(len(row_queries)).rjust(14) + str(len(statements)).rjust(14)
+                + '{:10.3f}'.format(elapsed))
+
+
+if __name__ == '__main__':
+    main()
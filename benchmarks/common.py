@@ -0,0 +1,133 @@
+"""
+Shared helpers for the jot benchmarks
+"""
+
+import sys
+import math
+import random
+import sqlite3
+import argparse
+
+from pathlib import Path
+from datetime import datetime, timedelta
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from jot.jot import Jot, Renderer
+
+
+def make_db(path, n_notes, seed=0):
+    # build a database of n_notes with a few nested items using the jot schema
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript((ROOT / 'jot' / 'create_db.sql').read_text())
+    conn.execute('PRAGMA user_version = {0:d}'.format(len(Jot.MIGRATIONS)))
+    conn.executemany('INSERT INTO Notes (status_id, description) VALUES (?, ?)',
+            ((rng.choice((1, 2, 5)), 'note ' + str(i)) for i in range(n_notes)))
+    conn.executemany('INSERT INTO Nest (parent, child) VALUES (?, ?)',
+            ((i, i + 1) for i in range(1, n_notes, 10)))
+    conn.commit()
+    conn.close()
+
+
+def generate_db(path, n_notes, seed=0, nested=0.3, depth=3, fanout=4, cycles=0, alias_density=0.05,
+        desc_words=12, desc_sigma=1.0, multiline=0.2, vocabulary=2000, due_density=0.2, priority_density=0.1):
+    # a seeded database shaped like a real one: `nested` of the notes in trees up to `depth`
+    # levels deep with 1..`fanout` children per parent, a leaf-to-root link in the first
+    # `cycles` trees, lognormal word counts around `desc_words` from a Zipf-weighted
+    # vocabulary, an alias on `alias_density` of the notes, a due date within a year either side
+    # of today on `due_density` and a priority of 1-3 on `priority_density`
+    rng = random.Random(seed)
+    words = ['w' + str(i) for i in range(vocabulary)]
+    weights = [1 / (i + 1) for i in range(vocabulary)]
+    conn = sqlite3.connect(path)
+    conn.executescript((ROOT / 'jot' / 'create_db.sql').read_text())
+    conn.execute('PRAGMA user_version = {0:d}'.format(len(Jot.MIGRATIONS)))
+
+    def notes():
+        for i in range(1, n_notes + 1):
+            n_words = max(1, int(rng.lognormvariate(math.log(desc_words), desc_sigma)))
+            text = ' '.join(rng.choices(words, weights, k=n_words))
+            if rng.random() < multiline:
+                cut = text.find(' ', len(text) // 2)
+                text = text[:cut] + '\n' + text[cut + 1:] if cut > 0 else text
+            alias = 'a' + base36(i) if rng.random() < alias_density else None
+            yield rng.choice((1, 1, 2, 2, 2, 3, 4, 5)), text, alias
+
+    conn.executemany('INSERT INTO Notes (status_id, description, alias) VALUES (?, ?, ?)', notes())
+
+    # breadth-first trees over a random sample of the notes
+    members = rng.sample(range(1, n_notes + 1), int(n_notes * nested))
+    links = []
+    trees = 0
+    looped = 0
+    while members:
+        root = members.pop()
+        trees += 1
+        level = deepest = [root]
+        for _ in range(depth):
+            below = []
+            for parent in level:
+                for _ in range(rng.randint(1, fanout)):
+                    if not members:
+                        break
+                    child = members.pop()
+                    links.append((parent, child))
+                    below.append(child)
+            if not below:
+                break
+            level = deepest = below
+        if looped < cycles and deepest[0] != root:
+            links.append((rng.choice(deepest), root))
+            looped += 1
+    conn.executemany('INSERT INTO Nest (parent, child) VALUES (?, ?)', links)
+
+    # drawn separately so the notes and links above stay those of earlier runs with the same seed
+    rng = random.Random(seed + 1)
+    today = datetime.now().date()
+    conn.executemany('UPDATE Notes SET due = ? WHERE notes_id = ?',
+            (((today + timedelta(days=rng.randint(-365, 365))).isoformat(), i)
+            for i in range(1, n_notes + 1) if rng.random() < due_density))
+    conn.executemany('UPDATE Notes SET priority = ? WHERE notes_id = ?',
+            ((rng.randint(1, 3), i) for i in range(1, n_notes + 1) if rng.random() < priority_density))
+    conn.commit()
+    conn.close()
+    return {'notes': n_notes, 'links': len(links), 'trees': trees, 'cycles': looped}
+
+
+def base36(n):
+    digits = ''
+    while True:
+        n, d = divmod(n, 36)
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'[d] + digits
+        if not n:
+            return digits
+
+
+def make_jot(db, pragmas=None):
+    # a Jot instance wired to db without reading ~/.jot or sys.argv
+    jot = Jot.__new__(Jot)
+    jot.SRC_DIR = ROOT / 'jot'
+    jot.JOT_DIR = Path(db).parent
+    jot.DB = Path(db)
+    jot.snippet_width = 50
+    jot.palette = ['248', '217', '46', '34', '136', '36', '147', '15', '180']
+    jot.colorize = True
+    jot.view_note_cmd = 'cat'
+    jot.EDITOR = 'true'
+    jot.renderer = Renderer(jot.palette, jot.snippet_width, jot.colorize)
+    jot.pragmas = dict(Jot.PRAGMA_DEFAULTS if pragmas is None else pragmas)
+    jot.tree = None
+    jot.parser = None
+    jot.profiler = None
+    jot.args = argparse.Namespace(find=None)
+    jot.connect()
+    return jot
+
+
+def count_queries(conn):
+    # returns a list that collects every statement run on conn
+    statements = []
+    conn.set_trace_callback(statements.append)
+    return statements
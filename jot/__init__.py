@@ -1,3 +1,3 @@
 __version__ = "0.0.0"
 
-from .jot import main
+from .jot import main, JotStore
@@ -1,4 +1,6 @@
 PRAGMA foreign_keys = ON;
+-- lets --archive hand freed pages back with incremental_vacuum; only takes before the first table
+PRAGMA auto_vacuum = INCREMENTAL;
 
 CREATE TABLE Notes (
 	notes_id integer PRIMARY KEY AUTOINCREMENT,
@@ -8,9 +10,75 @@ CREATE TABLE Notes (
 	created_at datetime NOT NULL DEFAULT (datetime(CURRENT_TIMESTAMP, 'localtime')),
 	modified_at datetime NOT NULL DEFAULT (datetime(CURRENT_TIMESTAMP, 'localtime')),
 	priority integer,
-	alias text
+	alias text,
+	first_line text, -- description up to its first newline or 1000 characters
+	is_multiline integer
+);
+
+CREATE INDEX notes_status ON Notes (status_id);
+CREATE UNIQUE INDEX notes_alias ON Notes (alias);
+-- each status's notes in due, priority and modified order, for --sort, --agenda and --overdue
+CREATE INDEX notes_status_due ON Notes (status_id, due);
+CREATE INDEX notes_status_priority ON Notes (status_id, priority);
+CREATE INDEX notes_status_modified ON Notes (status_id, modified_at);
+
+CREATE VIRTUAL TABLE NotesFTS USING fts5(
+	description,
+	content = 'Notes',
+	content_rowid = 'notes_id'
 );
 
+CREATE TRIGGER notes_fts_insert
+AFTER INSERT ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO NotesFTS(rowid, description) VALUES (NEW.notes_id, NEW.description);
+END;
+
+CREATE TRIGGER notes_fts_delete
+AFTER DELETE ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO NotesFTS(NotesFTS, rowid, description) VALUES ('delete', OLD.notes_id, OLD.description);
+END;
+
+CREATE TRIGGER notes_fts_update
+AFTER UPDATE OF description ON Notes
+FOR EACH ROW
+WHEN OLD.description IS NOT NEW.description
+BEGIN
+    INSERT INTO NotesFTS(NotesFTS, rowid, description) VALUES ('delete', OLD.notes_id, OLD.description);
+    INSERT INTO NotesFTS(rowid, description) VALUES (NEW.notes_id, NEW.description);
+END;
+
+-- what the summary table shows of each description, so it never reads the full text;
+-- first_line stops at the first newline or 1000 characters, wider than any note column.
+-- No length is kept: whether a note is cut is decided from first_line against the column width
+CREATE TRIGGER notes_summary_insert
+AFTER INSERT ON Notes
+FOR EACH ROW
+BEGIN
+    UPDATE Notes SET
+        first_line = CASE WHEN instr(substr(coalesce(NEW.description, ''), 1, 1000), char(10)) > 0
+            THEN substr(NEW.description, 1, instr(substr(NEW.description, 1, 1000), char(10)) - 1)
+            ELSE substr(coalesce(NEW.description, ''), 1, 1000) END,
+        is_multiline = instr(coalesce(NEW.description, ''), char(10)) > 0
+    WHERE notes_id = NEW.notes_id;
+END;
+
+CREATE TRIGGER notes_summary_update
+AFTER UPDATE OF description ON Notes
+FOR EACH ROW
+WHEN OLD.description IS NOT NEW.description
+BEGIN
+    UPDATE Notes SET
+        first_line = CASE WHEN instr(substr(coalesce(NEW.description, ''), 1, 1000), char(10)) > 0
+            THEN substr(NEW.description, 1, instr(substr(NEW.description, 1, 1000), char(10)) - 1)
+            ELSE substr(coalesce(NEW.description, ''), 1, 1000) END,
+        is_multiline = instr(coalesce(NEW.description, ''), char(10)) > 0
+    WHERE notes_id = NEW.notes_id;
+END;
+
 CREATE TABLE Alias (
 	notes_id integer,
 	alias text,
@@ -37,17 +105,188 @@ CREATE TABLE Nest (
 	Child integer
 );
 
+CREATE INDEX nest_parent ON Nest (parent);
+CREATE INDEX nest_child ON Nest (child);
+
+-- every (ancestor, descendant) pair of the Nest links with the length of the shortest path between
+-- them; a note on a circular link is its own ancestor. Kept current by the nest_closure triggers
+CREATE TABLE NestClosure (
+	ancestor integer NOT NULL,
+	descendant integer NOT NULL,
+	depth integer NOT NULL,
+	PRIMARY KEY (ancestor, descendant)
+) WITHOUT ROWID;
+
+CREATE INDEX nest_closure_descendant ON NestClosure (descendant);
+
+-- a new link joins every ancestor of the parent (and the parent) to every descendant
+-- of the child (and the child); depth keeps the shortest path. Repeated links add nothing.
+-- Pairs already joined are shortened, then new ones added: no UPSERT, which needs sqlite 3.24
+CREATE TRIGGER nest_closure_insert
+AFTER INSERT ON Nest
+FOR EACH ROW
+WHEN (SELECT count(*) FROM Nest WHERE parent = NEW.parent AND child = NEW.child) = 1
+BEGIN
+    UPDATE NestClosure SET depth = min(depth, 1
+        + (SELECT min(depth) FROM (SELECT NEW.parent AS ancestor, 0 AS depth
+            UNION ALL SELECT ancestor, depth FROM NestClosure WHERE descendant = NEW.parent) AS up
+            WHERE up.ancestor = NestClosure.ancestor)
+        + (SELECT min(depth) FROM (SELECT NEW.child AS descendant, 0 AS depth
+            UNION ALL SELECT descendant, depth FROM NestClosure WHERE ancestor = NEW.child) AS down
+            WHERE down.descendant = NestClosure.descendant))
+    WHERE ancestor IN (SELECT NEW.parent UNION SELECT ancestor FROM NestClosure WHERE descendant = NEW.parent)
+    AND descendant IN (SELECT NEW.child UNION SELECT descendant FROM NestClosure WHERE ancestor = NEW.child);
+
+    INSERT OR IGNORE INTO NestClosure (ancestor, descendant, depth)
+    SELECT up.ancestor, down.descendant, min(up.depth + 1 + down.depth)
+    FROM (SELECT NEW.parent AS ancestor, 0 AS depth
+            UNION ALL SELECT ancestor, depth FROM NestClosure WHERE descendant = NEW.parent) AS up,
+        (SELECT NEW.child AS descendant, 0 AS depth
+            UNION ALL SELECT descendant, depth FROM NestClosure WHERE ancestor = NEW.child) AS down
+    GROUP BY up.ancestor, down.descendant;
+END;
+
+-- only pairs from an ancestor of the parent to a descendant of the child can have
+-- depended on the link. They are dropped, then found again by walking into the
+-- child's side from the distances that did not depend on it; the walk is bounded,
+-- so circular links end it too. Nothing changes while an identical link remains.
+CREATE TRIGGER nest_closure_delete
+AFTER DELETE ON Nest
+FOR EACH ROW
+WHEN NOT EXISTS (SELECT 1 FROM Nest WHERE parent = OLD.parent AND child = OLD.child)
+BEGIN
+    DELETE FROM NestClosure
+    WHERE ancestor IN (SELECT OLD.parent UNION SELECT ancestor FROM NestClosure WHERE descendant = OLD.parent)
+    AND descendant IN (SELECT OLD.child UNION SELECT descendant FROM NestClosure WHERE ancestor = OLD.child);
+
+    INSERT INTO NestClosure (ancestor, descendant, depth)
+    SELECT top, id, min(depth) FROM (
+        WITH RECURSIVE
+        up(id) AS (SELECT OLD.parent UNION SELECT Nest.parent FROM Nest JOIN up ON Nest.child = up.id),
+        down(id) AS (SELECT OLD.child UNION SELECT Nest.child FROM Nest JOIN down ON Nest.parent = down.id),
+        seed(top, id, depth) AS (
+            SELECT id, id, 0 FROM up
+            UNION ALL SELECT ancestor, descendant, depth FROM NestClosure
+            WHERE ancestor IN (SELECT id FROM up) AND descendant NOT IN (SELECT id FROM down)),
+        reach(top, id, depth) AS (
+            SELECT seed.top, Nest.child, seed.depth + 1 FROM seed JOIN Nest ON Nest.parent = seed.id
+            WHERE Nest.child IN (SELECT id FROM down)
+            UNION
+            SELECT reach.top, Nest.child, reach.depth + 1 FROM reach JOIN Nest ON Nest.parent = reach.id
+            WHERE Nest.child IN (SELECT id FROM down)
+            AND reach.depth <= (SELECT max(depth) FROM seed) + (SELECT count(*) FROM down))
+        SELECT top, id, depth FROM reach)
+    GROUP BY top, id;
+END;
+
+-- one row per part of an attachment; rows sharing sha256 hold its content in part order.
+-- sha256 and part follow the blob, so they are read through files_sha256, never the table row
 CREATE TABLE Files (
 	file_id integer PRIMARY KEY AUTOINCREMENT,
-	file blob
+	file blob,
+	sha256 text,
+	part integer NOT NULL DEFAULT 0
 );
 
+CREATE UNIQUE INDEX files_sha256 ON Files (sha256, part);
+
+-- file_id is the attachment's part 0; name is the file name it was attached under
 CREATE TABLE NoteFiler (
 	notefiler_id integer PRIMARY KEY AUTOINCREMENT,
 	file_id integer,
-	notes_id integer
+	notes_id integer,
+	name text,
+	sha256 text
 );
 
+CREATE INDEX notefiler_notes ON NoteFiler (notes_id);
+CREATE INDEX notefiler_sha256 ON NoteFiler (sha256);
+
+-- a journal for --sync-export and --sync-import: one entry per write to a Notes, Nest or Alias row.
+-- An export sends each row's current state (or its deletion) once, at its latest seq, so compaction
+-- keeps only that entry
+CREATE TABLE Changes (
+	seq integer PRIMARY KEY AUTOINCREMENT,
+	tbl text NOT NULL,
+	row_id integer NOT NULL
+);
+
+CREATE INDEX changes_row ON Changes (tbl, row_id);
+
+-- db_id names this database to the ones it syncs to; compacted_seq is where compaction last ran
+CREATE TABLE DbInfo (
+	name text PRIMARY KEY,
+	value text
+);
+
+INSERT INTO DbInfo (name, value) VALUES ('db_id', lower(hex(randomblob(16))));
+
+-- the last seq of each other database's journal that --sync-import has applied here
+CREATE TABLE ChangesSeen (
+	db_id text PRIMARY KEY,
+	seq integer NOT NULL
+);
+
+CREATE TRIGGER changes_notes_insert
+AFTER INSERT ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Notes', NEW.notes_id);
+END;
+
+-- the summary columns follow the description, so they are not changes of their own
+CREATE TRIGGER changes_notes_update
+AFTER UPDATE OF notes_id, status_id, due, description, created_at, modified_at, priority, alias ON Notes
+FOR EACH ROW
+WHEN OLD.notes_id IS NOT NEW.notes_id OR OLD.status_id IS NOT NEW.status_id OR OLD.due IS NOT NEW.due
+    OR OLD.description IS NOT NEW.description OR OLD.created_at IS NOT NEW.created_at
+    OR OLD.modified_at IS NOT NEW.modified_at OR OLD.priority IS NOT NEW.priority OR OLD.alias IS NOT NEW.alias
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Notes', OLD.notes_id), ('Notes', NEW.notes_id);
+END;
+
+CREATE TRIGGER changes_notes_delete
+AFTER DELETE ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Notes', OLD.notes_id);
+END;
+
+CREATE TRIGGER changes_nest_insert
+AFTER INSERT ON Nest
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Nest', NEW.nest_id);
+END;
+
+CREATE TRIGGER changes_nest_delete
+AFTER DELETE ON Nest
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Nest', OLD.nest_id);
+END;
+
+CREATE TRIGGER changes_alias_insert
+AFTER INSERT ON Alias
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Alias', NEW.rowid);
+END;
+
+CREATE TRIGGER changes_alias_update
+AFTER UPDATE ON Alias
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Alias', OLD.rowid), ('Alias', NEW.rowid);
+END;
+
+CREATE TRIGGER changes_alias_delete
+AFTER DELETE ON Alias
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Alias', OLD.rowid);
+END;
+
 --populate tables
 
 INSERT INTO Status(status) values ('o=o'), ('[ ]'), ('[x]'), ('[0]'), ('[\]');
@@ -2,30 +2,1145 @@
 
 """
 JOT is a note taking and task management tool
+
+Modules only some commands need (csv, json, subprocess, tempfile, pydoc,
+shutil) are imported where they are used to keep startup fast.
 """
 
 import os
+import io
 import sys
-import platform
-import subprocess
 import argparse
-import tempfile
 import sqlite3
-import pydoc
+import marshal
 import math
-import csv
-import shutil
+import re
+import functools
+import contextlib
+import itertools
+import time
 
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+class Renderer:
+    """
+    Builds the lines of the summary table. ANSI styles, the separator line
+    and the generation markers are computed once and reused for every row.
+    """
+    chr_key = ['|', '~', 'v', '&']
+
+    def __init__(self, palette, snippet_width, colorize):
+        self.palette = palette
+        self.snippet_width = snippet_width
+        self.colorize = colorize
+        self.styles = {} # (status_id, trim_key) -> ANSI prefixes
+        self.templates = {} # (status_id, status, trim_key, gen) -> summary row template
+        self.no_due = ''.center(10)
+        self.gen_symbols = {}
+        self.headers = {}
+        self.line = self.colorize_summary('+------------+-+-----+' + ''.ljust(snippet_width, '-') + '+')
+        if colorize:
+            self.text_start = self.style_parser(palette[0], 0) + '| ' + self.style_parser(palette[8], 0)
+            self.text_end = self.style_parser(palette[0], 0) + '|'
+        else:
+            self.text_start = '| '
+            self.text_end = '|'
 
+    def style_parser(self, color = 15, style = 0):
+        return '\x1b[' + str(style) + ';38;5;' + str(color) + 'm'
 
-class Jot:
-    def __init__(self, **kwargs):
-        self.read_config()
+    def row_styles(self, status_id, trim_key):
+        key = (status_id, trim_key)
+        if key not in self.styles:
+            palette = self.palette
+            note_col = palette[0:6]
+            self.styles[key] = (
+                    self.style_parser(palette[7], 0),
+                    self.style_parser(palette[0] if status_id == 0 else palette[6], 3),
+                    self.style_parser(note_col[status_id], 0),
+                    self.style_parser(palette[0], 0 if trim_key == 0 else 5))
+        return self.styles[key]
+
+    def gen_symbol(self, gen):
+        if gen not in self.gen_symbols:
+            if gen == 0:
+                self.gen_symbols[gen] = ''
+            elif gen == 1:
+                self.gen_symbols[gen] = '>'.ljust(gen, '>') + ' '
+            elif gen > 1:
+                self.gen_symbols[gen] = '>'.rjust(gen, '-') + ' '
+            elif gen == -1:
+                self.gen_symbols[gen] = '? '
+        return self.gen_symbols[gen]
+
+    def header(self, db):
+        if db not in self.headers:
+            self.headers[db] = self.colorize_summary('|     Date   |?|  ID   Note ' + str(db).rjust(self.snippet_width-7) + ' |')
+        return self.headers[db]
+
+    def db_label(self, label):
+        # marks where the rows of another database start in an --across table
+        return self.colorize_summary('|                     ' + ('@' + label).ljust(self.snippet_width) + '|')
+
+    def smart_wrap(self, text, width):
+        text_list = text.split('\n')
+        if not isinstance(text_list, list):
+            text_list = [text_list]
+        wrap = []
+        for line in text_list:
+            indent = len(line) - len(line.lstrip())
+            n = width - indent
+            line = line[indent:]
+            wrap.append('\n'.join([(''.ljust(indent if i == 0 else indent + 2) + line[i:i+n]) for i in range(0, len(line), n)]))
+        return '\n'.join(wrap)
+
+    def note_lines(self, row, gen = 0, find = None, full = False):
+        # summary row plus the full text (full) and snippets of what the compiled pattern find matched below it
+        lines = [self.summary_formatted(row, gen)]
+        if full:
+            if len(row[3]) > self.snippet_width:
+                lines.extend(self.text_start + i.ljust(self.snippet_width + 20) + self.text_end
+                        for i in self.smart_wrap(row[3], width = self.snippet_width + 20).split('\n'))
+            lines.append(self.line)
+
+        if find:
+            lines.extend(self.snippet_lines(row[3], find))
+        return lines
+
+    def snippet_lines(self, text, pattern):
+        # each line with a match, cut to a window around its first match with every match inside
+        # the window upper-cased; the pattern is only run from the first match to the window's end
+        width = self.snippet_width
+        lines = []
+        match = pattern.search(text)
+        while match:
+            start = match.start()
+            line_start = text.rfind('\n', 0, start) + 1
+            line_end = text.find('\n', start)
+            line_end = len(text) if line_end < 0 else line_end
+            line = '~' + text[line_start:line_end] + '~' # ~ marks where the line starts and ends
+            first = start - line_start + 1
+            room = width - (min(match.end(), line_end) - start)
+            left = max(0, min(first - math.ceil(room / 2), len(line) - width)) if room > 0 else first
+            right = min(line_end, line_start - 1 + left + width) # in text offsets
+            cut = [line[left:first]]
+            shown = start
+            for match in pattern.finditer(text, start, right):
+                if match.end() > match.start():
+                    cut += [text[shown:match.start()], match.group().upper()]
+                    shown = match.end()
+            cut.append(line[shown - line_start + 1:left + width])
+            lines.append(self.colorize_summary('|                     ' + ''.join(cut).ljust(width) + '|'))
+            match = pattern.search(text, line_end + 1) if line_end < len(text) else None
+        return lines
+
+    def summary_formatted(self, row, gen = 0):
+        return self.summary_rows([row], [gen])[0]
+
+    def summary_rows(self, rows, gens):
+        # summary_formatted for many rows at once, with lookups hoisted out of the loop
+        width = self.snippet_width
+        no_due = self.no_due
+        by_gen = {} # gen -> (room for note text, text after the marker, templates by status)
+        lines = []
+        append = lines.append
+        for row, gen in zip(rows, gens):
+            if gen in by_gen:
+                room, lead, status_templates = by_gen[gen]
+            else:
+                room, lead, status_templates = by_gen[gen] = (width - abs(gen), ' ' if gen else '', {})
+            if room < 0 or (row[0] > 99999 and not row[7]): # marker or id overflow their columns
+                append(self.summary_sliced(row, gen))
+                continue
+            note, newline, rest = row[3].partition('\n')
+            note = lead + note
+            if row[9] in status_templates:
+                templates = status_templates[row[9]]
+            else:
+                templates = status_templates[row[9]] = [self.summary_template((row[8], row[9], end_chr, gen)) for end_chr in range(4)]
+            # end_chr: 0 fits, 1 too long, 2 multiline, 3 too long and multiline
+            template = templates[(len(note) > room) + (2 if newline else 0)]
+            append(template % (row[2].center(10) if row[2] else no_due, row[7][:5] if row[7] else row[0], note))
+        return lines
+
+    def summary_template(self, key):
+        # everything in a summary row except the date, id/alias and note text, as a %-template
+        if key in self.templates:
+            return self.templates[key]
+        status_id, status, end_chr, gen = key
+        g = abs(gen)
+        sts_str = (status if status else '').center(3, '|').replace('%', '%%')
+        marker = self.gen_symbol(gen)[:g]
+        end = self.chr_key[end_chr]
+        note_field = '%-{0}.{0}s'.format(self.snippet_width - g) # cut and pad to the room left
+        if self.colorize:
+            reset, ind, note, trim = self.row_styles(status_id, end_chr)
+            template = trim + '|' + note + ' %s ' + note + sts_str + ind + '%5s ' + ind + marker + note + note_field + trim + end + reset
+        else:
+            template = '| %s ' + sts_str + '%5s ' + marker + note_field + end + ' '
+        self.templates[key] = template
+        return template
+
+    def summary_sliced(self, row, gen = 0):
+        # general form, for markers wider than the note column or ids wider than theirs
+        width = self.snippet_width
+        first_line, newline, rest = row[3].partition('\n')
+        note_summary = self.gen_symbol(gen) + first_line
+        if len(note_summary) > width:
+            end_chr = 3 if newline else 1
+        else:
+            end_chr = 2 if newline else 0
+        note_str = note_summary[:width].ljust(width) + self.chr_key[end_chr]
+        sts_str = (row[9] if row[9] else '').center(3, '|')
+        due_str = (row[2] if row[2] else '').center(10)
+        id_str = row[7][:5].rjust(5) if row[7] else str(row[0]).rjust(5)
+        plain_summary = '| ' + due_str + ' ' + sts_str + id_str + ' ' + note_str + ' '
+        return(self.colorize_summary(plain_summary, gen, row[8], end_chr))
+
+    def colorize_summary(self, my_str, gen = 0, status_id = 0, trim_key = 0):
+        if self.colorize:
+            reset, ind, note, end = self.row_styles(status_id, trim_key)
+            gen_stop = 22 + abs(gen)
+            note_stop = 22 + self.snippet_width
+            return(end + my_str[0:1] + note + my_str[1:13] + note + my_str[13:16] + ind + my_str[16:22] + \
+                    ind + my_str[22:gen_stop] + note + my_str[gen_stop:note_stop] + \
+                    end + my_str[note_stop:note_stop+1] + reset)
+        else:
+            return(my_str)
+
+
+class FamilyTree:
+    """
+    In-memory copy of the Nest table: children of each parent (and parents
+    of each child) in nest_id order. Writes update it link by link; the walk
+    for the nested summary is redone only after a link changes.
+    """
+    def __init__(self, links):
+        self.kids = {}
+        self.parents = {}
+        for parent, child in links:
+            self.kids.setdefault(parent, []).append(child)
+            self.parents.setdefault(child, []).append(parent)
+        self.walked = None
+
+    def link(self, parent, child):
+        self.kids.setdefault(parent, []).append(child)
+        self.parents.setdefault(child, []).append(parent)
+        self.walked = None
+
+    def unlink(self, parent, child):
+        # every Nest row for the pair, as DELETE ... WHERE parent = ? and child = ? does
+        for key, value, table in ((parent, child, self.kids), (child, parent, self.parents)):
+            family = [i for i in table.get(key, []) if i != value]
+            if family:
+                table[key] = family
+            else:
+                table.pop(key, None)
+        self.walked = None
+
+    def unlink_parents(self, child):
+        for parent in set(self.parents.get(child, [])):
+            self.unlink(parent, child)
+
+    def unlink_note(self, note_id):
+        self.unlink_parents(note_id)
+        for child in set(self.kids.get(note_id, [])):
+            self.unlink(note_id, child)
+
+    def walk(self):
+        # (note_id, gen) in display order and the ids that are both parent and child;
+        # iterative so deep trees hit no recursion limit
+        if self.walked is not None:
+            return self.walked
+        kids = self.kids
+        parents = set(kids)
+        children = set(self.parents)
+        parent_children = children & parents
+        first_parents = sorted(parents - parent_children)
+        id_gen = []
+        for root in first_parents:
+            stack = [(root, 1)]
+            path = [] # ids on the branch being walked
+            on_path = set()
+            while stack:
+                note_id, gen = stack.pop()
+                while len(path) >= gen:
+                    on_path.discard(path.pop())
+                if note_id in on_path: # circular link back to an ancestor
+                    continue
+                path.append(note_id)
+                on_path.add(note_id)
+                id_gen.append((note_id, gen))
+                stack.extend((child, gen + 1) for child in reversed(kids.get(note_id, [])))
+        self.walked = (id_gen, parent_children)
+        return self.walked
+
+
+class TracedCursor(sqlite3.Cursor):
+    """
+    Cursor that charges the time and rows of each statement, including the
+    rows fetched from it later, to its connection's Profiler.
+    """
+    def execute(self, sql, parameters=()):
+        self.execution = self.connection.profiler.execution(sql)
+        with self.connection.profiler.timed(self.execution):
+            super().execute(sql, parameters)
+        self.count_changes()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.execution = self.connection.profiler.execution(sql)
+        with self.connection.profiler.timed(self.execution):
+            super().executemany(sql, seq_of_parameters)
+        self.count_changes()
+        return self
+
+    def executescript(self, sql_script):
+        self.execution = self.connection.profiler.execution(sql_script)
+        with self.connection.profiler.timed(self.execution):
+            super().executescript(sql_script)
+        return self
+
+    def count_changes(self):
+        if self.rowcount > 0:
+            self.execution[2] += self.rowcount
+
+    def __next__(self):
+        with self.connection.profiler.timed(self.execution) as execution:
+            row = super().__next__()
+            execution[2] += 1
+        return row
+
+    def fetchone(self):
+        with self.connection.profiler.timed(self.execution) as execution:
+            row = super().fetchone()
+            execution[2] += row is not None
+        return row
+
+    def fetchmany(self, *args):
+        with self.connection.profiler.timed(self.execution) as execution:
+            rows = super().fetchmany(*args)
+            execution[2] += len(rows)
+        return rows
+
+    def fetchall(self):
+        with self.connection.profiler.timed(self.execution) as execution:
+            rows = super().fetchall()
+            execution[2] += len(rows)
+        return rows
+
+
+class TracedConnection(sqlite3.Connection):
+    profiler = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class Profiler:
+    """
+    Wall time of each phase of a command and of every SQL statement, for
+    --profile and JOT_TRACE. Only built when asked for; otherwise phases are
+    a shared null context and connections are plain sqlite3 ones.
+    """
+    def __init__(self, slow_log = None):
+        self.started = time.perf_counter()
+        self.phases = {} # name -> [calls, seconds, seconds in nested phases and sql]
+        self.stack = [] # [name, start, seconds in nested phases and sql] of the open phases
+        self.executions = [] # [sql, seconds, rows, phase] per statement run
+        self.slow_log = slow_log # (path, threshold in seconds) or None
+
+    def connect(self, path):
+        conn = sqlite3.connect(path, factory=TracedConnection)
+        conn.profiler = self
+        return conn
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        frame = [name, time.perf_counter(), 0.0]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            seconds = time.perf_counter() - frame[1]
+            calls, total, inner = self.phases.get(name, (0, 0.0, 0.0))
+            self.phases[name] = [calls + 1, total + seconds, inner + frame[2]]
+            if self.stack:
+                self.stack[-1][2] += seconds
+
+    def execution(self, sql):
+        execution = [sql, 0.0, 0, self.stack[-1][0] if self.stack else '']
+        self.executions.append(execution)
+        return execution
+
+    @contextlib.contextmanager
+    def timed(self, execution):
+        start = time.perf_counter()
+        try:
+            yield execution
+        finally:
+            seconds = time.perf_counter() - start
+            execution[1] += seconds
+            if self.stack:
+                self.stack[-1][2] += seconds
+
+    def report(self, out = None, top = 15):
+        # phases in the order they ran, then statements by total time
+        out = out or sys.stderr
+        total = time.perf_counter() - self.started
+        lines = ['jot profile: {0:.1f} ms'.format(total * 1000),
+                'phase'.ljust(12) + 'calls'.rjust(7) + 'total ms'.rjust(10) + 'self ms'.rjust(10)]
+        for name, (calls, seconds, inner) in self.phases.items():
+            lines.append(name.ljust(12) + str(calls).rjust(7) + '{:10.2f}'.format(seconds * 1000)
+                    + '{:10.2f}'.format((seconds - inner) * 1000))
+        statements = {}
+        for sql, seconds, rows, phase in self.executions:
+            key = (' '.join(sql.split()), phase)
+            calls, total_seconds, total_rows = statements.get(key, (0, 0.0, 0))
+            statements[key] = (calls + 1, total_seconds + seconds, total_rows + rows)
+        lines.append('sql: {0} statements, {1:.2f} ms'.format(len(self.executions),
+                sum(i[1] for i in self.executions) * 1000))
+        lines.append('ms'.rjust(9) + 'calls'.rjust(7) + 'rows'.rjust(8) + '  ' + 'phase'.ljust(8) + 'statement')
+        for (sql, phase), (calls, seconds, rows) in sorted(statements.items(), key=lambda i: -i[1][1])[:top]:
+            lines.append('{:9.2f}'.format(seconds * 1000) + str(calls).rjust(7) + str(rows).rjust(8) + '  '
+                    + phase.ljust(8) + (sql if len(sql) <= 80 else sql[:77] + '...'))
+        out.write('\n'.join(lines) + '\n')
+
+    def log_slow(self, command):
+        # append statements slower than the threshold to the slow query log
+        if not self.slow_log:
+            return
+        path, threshold = self.slow_log
+        slow = [i for i in self.executions if i[1] >= threshold]
+        if slow:
+            stamp = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+            with open(path, 'a') as f:
+                f.writelines(stamp + '\t{:.1f} ms\t'.format(seconds * 1000) + str(rows) + ' rows\t'
+                        + command + '\t' + ' '.join(sql.split()) + '\n' for sql, seconds, rows, phase in slow)
+
+
+@functools.lru_cache(maxsize=64)
+def compiled_pattern(pattern):
+    return re.compile(pattern)
+
+
+def regexp(pattern, value):
+    # `value REGEXP pattern` inside sqlite; each distinct pattern is compiled once
+    return value is not None and compiled_pattern(pattern).search(value) is not None
+
+
+class JotStore:
+    """
+    A jot database without the command line: open one with JotStore(path),
+    write batches with add_many, update_many, remove_many and set_parents
+    inside `with store.transaction():`, and read rows lazily with iter_notes.
+    Jot is the command line over it.
+    """
+    QUERY_CHUNK = 500 # rows fetched and rendered per batch
+    WRITE_CHUNK = 5000 # rows per executemany in the batch writes
+    # ordered schema upgrades: a database at PRAGMA user_version n has had the first n applied.
+    # create_db.sql is always the latest schema, so append here and update it together.
+    MIGRATIONS = ['migrate_fts.sql', 'migrate_indexes.sql', 'migrate_files.sql', 'migrate_closure.sql',
+            'migrate_summary.sql', 'migrate_sort_indexes.sql', 'migrate_changes.sql']
+    # sqlite settings applied on every connect, in this order; config.csv overrides, blank keeps sqlite's default
+    PRAGMA_DEFAULTS = {'busy_timeout': '5000', 'journal_mode': 'WAL', 'synchronous': 'NORMAL',
+            'cache_size': '-16000', 'mmap_size': '268435456'}
+    FILE_CHUNK = 1 << 20 # bytes read or written per step when streaming an attachment
+    FILE_PART = 1 << 28 # bytes per Files row; sqlite caps a single blob at 1e9
+    # incremental blob I/O arrived in python 3.11; before it each FILE_CHUNK is a Files row of its own
+    BLOB_IO = hasattr(sqlite3.Connection, 'blobopen')
+    FIND_TOKENS = r'"([^"]*)"|([()])|([^\s()"]+)' # --find as "phrases", parentheses and words
+    FIND_OPERATORS = ('AND', 'OR', 'NOT')
+    # a note row as the Renderer reads it: Notes then Status, with {0} as the text column
+    ROW_COLUMNS = 'Notes.notes_id, Notes.status_id, Notes.due, {0}, Notes.created_at, Notes.modified_at, \
+        Notes.priority, Notes.alias, Status.status_id, Status.status'
+    # the text of a summary row: its first line, and a newline if more follows; never the full description
+    SUMMARY_TEXT = "Notes.first_line || CASE WHEN Notes.is_multiline THEN char(10) ELSE '' END"
+    # --sort key -> (column, its place in ROW_COLUMNS, direction, which notes have a value to sort by)
+    SORTS = {'due': ('Notes.due', 3, '', 'Notes.due IS NOT NULL'),
+            'priority': ('Notes.priority', 7, '', 'Notes.priority > 0'),
+            'modified': ('Notes.modified_at', 6, ' DESC', None)}
+    # journaled table -> (its key, the columns a change record carries); see create_db.sql's Changes
+    SYNC_TABLES = {'Notes': ('notes_id', ('notes_id', 'status_id', 'due', 'description', 'created_at',
+                'modified_at', 'priority', 'alias')),
+            'Nest': ('nest_id', ('nest_id', 'parent', 'child')),
+            'Alias': ('rowid', ('rowid', 'notes_id', 'alias'))}
+    COMPACT_EVERY = 10000 # journal entries written between compactions of Changes
+
+    def __init__(self, db, pragmas = None, profiler = None):
+        self.SRC_DIR = Path(__file__).parent
+        self.DB = Path(db)
+        self.pragmas = dict(self.PRAGMA_DEFAULTS if pragmas is None else pragmas)
+        self.profiler = profiler
+        self.tree = None # FamilyTree, loaded on first use
         self.connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def phase(self, name):
+        # times a part of the command under --profile; a no-op otherwise (an empty ExitStack,
+        # as nullcontext needs python 3.7)
+        return self.profiler.phase(name) if self.profiler else contextlib.ExitStack()
+
+    def notice(self, message):
+        # what the store tells about itself (a new database, a schema upgrade) goes to stderr,
+        # leaving stdout to whatever the caller prints
+        print(message, file=sys.stderr)
+
+    def connect(self):
+        undefined_db = not self.DB.exists()
+        if undefined_db:
+            self.notice(f"creating new database: {self.DB}")
+            self.conn = self.open_db()
+            self.cursor = self.conn.cursor()
+            # schema first: journal_mode writes the header that auto_vacuum is settable only before
+            self.create_schema(self.cursor)
+            self.apply_pragmas()
+        else:
+            try:
+                self.conn = self.open_db()
+                self.cursor = self.conn.cursor()
+            # RSD TODO: Should explicitly catch exceptions
+            except:
+                self.notice('attempting to connect to ' + str(self.DB))
+                sys.exit("Connection to sqlite db failed!")
+            self.apply_pragmas()
+            self.upgrade_db()
+
+    def create_schema(self, cursor):
+        with open(self.SRC_DIR / "create_db.sql") as sql_file:
+            sql_as_string = sql_file.read()
+        cursor.executescript(sql_as_string)
+        cursor.execute('PRAGMA user_version = {0:d}'.format(len(self.MIGRATIONS)))
+        cursor.connection.commit()
+
+    def open_db(self):
+        conn = sqlite3.connect(self.DB) if self.profiler is None else self.profiler.connect(self.DB)
+        try:
+            conn.create_function('regexp', 2, regexp, deterministic=True)
+        except (TypeError, sqlite3.NotSupportedError): # the flag needs python 3.8 and sqlite 3.8.3
+            conn.create_function('regexp', 2, regexp)
+        return conn
+
+    def apply_pragmas(self):
+        for name, value in self.pragmas.items():
+            value = str(value).strip()
+            if not value:
+                continue
+            if not re.fullmatch(r'-?[0-9]+|[A-Za-z]+', value):
+                sys.exit('invalid ' + name + ' in config.csv: ' + value)
+            self.cursor.execute('PRAGMA {0} = {1}'.format(name, value))
+
+    def upgrade_db(self, cursor = None, db = None):
+        # apply each schema upgrade this database (or db, through cursor) has not seen yet. A step and
+        # its user_version bump commit together, so a step that fails leaves nothing behind and is run
+        # again whole. Steps are also safe to re-run over their own results: tables, indexes and
+        # triggers use IF NOT EXISTS, backfills skip rows already there, and a column the table
+        # already has is not added again
+        cursor = cursor or self.cursor
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for step, name in enumerate(self.MIGRATIONS[version:], start=version + 1):
+            self.notice('upgrading ' + str(db or self.DB) + ': ' + name)
+            with open(self.SRC_DIR / name) as sql_file:
+                sql_as_string = sql_file.read()
+            sql_as_string = re.sub(r'ALTER TABLE (\w+) ADD COLUMN (\w+)[^;]*;',
+                    lambda m: '' if self.has_column(cursor, m.group(1), m.group(2)) else m.group(0), sql_as_string)
+            cursor.executescript('BEGIN;\n' + sql_as_string + \
+                    '\nPRAGMA user_version = {0:d};\nCOMMIT;'.format(step))
+
+    def has_column(self, cursor, table, column):
+        sql = 'SELECT 1 FROM pragma_table_info(?) WHERE name = ? COLLATE NOCASE'
+        return cursor.execute(sql, (table, column)).fetchone() is not None
+
+    @contextlib.contextmanager
+    def transaction(self, write = True):
+        # run a whole command as one all-or-nothing write; inside another transaction, join it.
+        # A write takes the write lock at BEGIN IMMEDIATE, where busy_timeout waits for it: a deferred
+        # transaction that reads first cannot wait once another connection commits, and fails at once
+        if self.conn.in_transaction:
+            yield
+            return
+        self.cursor.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        changes = self.conn.total_changes
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            self.tree = None # may hold links that were just rolled back
+            raise
+        else:
+            if self.conn.total_changes != changes: # only a write can have grown the journal
+                self.compact_changes(self.COMPACT_EVERY)
+            self.conn.commit()
+
+    def row_columns(self, full_text = True):
+        return self.ROW_COLUMNS.format('Notes.description' if full_text else self.SUMMARY_TEXT)
+
+    def find_tokens(self, term):
+        # (kind, text) for each part of a --find term: an operator, a parenthesis or something to match
+        for phrase, paren, word in re.findall(self.FIND_TOKENS, term):
+            if paren or word in self.FIND_OPERATORS:
+                yield 'operator', paren or word
+            elif phrase:
+                yield 'phrase', phrase
+            elif word.rstrip('*'):
+                yield 'word', word.rstrip('*')
+
+    def match_query(self, term):
+        # words match as token prefixes, "quoted text" as a phrase; all must be present unless
+        # joined by OR, NOT excludes what follows it and parentheses group
+        parts = []
+        for kind, text in self.find_tokens(term):
+            # fts5 only joins a parenthesis to what comes before it with an explicit AND
+            if kind != 'operator' or text == '(':
+                if parts and parts[-1] not in self.FIND_OPERATORS + ('(',):
+                    parts.append('AND')
+            if kind == 'operator':
+                parts.append(text)
+            else:
+                parts.append('"' + text.replace('"', '""') + '"' + ('*' if kind == 'word' else ''))
+        return ' '.join(parts)
+
+    def search_notes(self, term):
+        sql = ''' SELECT rowid FROM NotesFTS WHERE NotesFTS MATCH ? ORDER BY bm25(NotesFTS) '''
+        found_id = self.cursor.execute(sql, (self.match_query(term),)).fetchall()
+        found_id = tuple([i[0] for i in found_id]) # best match first
+        return found_id
+
+    def family_tree(self):
+        # load the whole hierarchy once; a resident server keeps it between commands
+        with self.phase('tree'):
+            if self.tree is None:
+                sql = ' SELECT parent, child FROM Nest ORDER BY nest_id '
+                self.tree = FamilyTree(self.cursor.execute(sql))
+            return self.tree.walk()
+
+    def nest_notes(self, my_ids, walked = None):
+        # calculate nesting of items, in this database's hierarchy unless given another one's walk
+        id_gen, parent_children = walked or self.family_tree()
+        # filter nested items
+        my_ids = set(my_ids)
+        id_gen = [(i, g) for i, g in id_gen if i in my_ids]
+        ids = [i for i, g in id_gen]
+        gens = [g for i, g in id_gen]
+        # add unresolved nested items that are in my_ids
+        circular = parent_children - set(ids) & my_ids
+        circular = list(circular)
+        circular.sort()
+        ids.extend(circular)
+        gens.extend([-1] * len(circular))
+        # add free items that are in my_ids
+        free = my_ids - set(ids)
+        free = list(free)
+        free.sort()
+        ids.extend(free)
+        gens.extend([0] * len(free))
+        return ids, gens
+
+    def note_rows(self, mode, status_show, find = None, after = None, regex = None, full_text = True, sort = None, due = None):
+        # (row, gen, key) in display order, starting after the row whose key is `after`;
+        # key is (id, n) for the nth listing of the note. Without full_text a row has only
+        # the part of the description a summary row shows
+        if after is not None and not isinstance(after, tuple):
+            after = (after, 1)
+        if sort or due:
+            return self.sorted_rows(status_show, sort, due, find, regex, after, full_text)
+        # the unary + keeps sqlite walking notes_id order rather than sorting every notes_status match
+        status_filter = "+Notes.status_id IN ({seq})".format(seq=','.join(['?']*len(status_show)))
+        sql_vars = tuple(status_show)
+        if regex: # tested by the registered regexp function, so only matching rows leave sqlite
+            status_filter += " AND Notes.description REGEXP ?"
+            sql_vars += (regex,)
+        if mode == 'nested':
+            return self.nested_rows(status_filter, sql_vars, find, after, bool(regex), full_text)
+        columns = self.row_columns(full_text)
+        if find: # best matches first
+            sql = "SELECT " + columns + " FROM NotesFTS \
+            JOIN Notes ON Notes.notes_id = NotesFTS.rowid \
+            LEFT JOIN Status ON Notes.status_id = Status.status_id \
+            WHERE NotesFTS MATCH ? AND " + status_filter + " ORDER BY bm25(NotesFTS)"
+            rows = self.rows_after(self.conn.execute(sql, (self.match_query(find),) + sql_vars), after)
+        else: # keyset: the index on notes_id finds the first row without reading the ones before it
+            sql = "SELECT " + columns + " FROM Notes LEFT JOIN Status ON Notes.status_id = Status.status_id \
+            WHERE " + status_filter + " AND Notes.notes_id > ? ORDER BY Notes.notes_id"
+            rows = self.conn.execute(sql, sql_vars + (after[0] if after else 0,))
+        return ((row, 0, (row[0], 1)) for row in rows)
+
+    def sorted_rows(self, status_show, sort = None, due = None, find = None, regex = None, after = None, full_text = True):
+        # (row, gen, key) of the notes with a value to sort by (or a due date in [due) for --agenda
+        # and --overdue) in sort order. Each status is read in order from its (status_id, column)
+        # index and sqlite merges them, so a page costs the rows on it, not the table
+        column, place, direction, has_value = self.SORTS[sort or 'due']
+        where = []
+        params = ()
+        if due:
+            where.append('Notes.due >= ? AND Notes.due < ?')
+            params += tuple(due)
+        elif has_value:
+            where.append(has_value)
+        if find:
+            where.append('Notes.notes_id IN (SELECT rowid FROM NotesFTS WHERE NotesFTS MATCH ?)')
+            params += (self.match_query(find),)
+        if regex:
+            where.append('Notes.description REGEXP ?')
+            params += (regex,)
+        arm = "SELECT " + self.row_columns(full_text) + " FROM Notes LEFT JOIN Status ON Notes.status_id = Status.status_id \
+        WHERE Notes.status_id = ?" + ''.join(' AND ' + i for i in where)
+        sql = ' UNION ALL '.join([arm] * len(status_show)) + ' ORDER BY {0}{1}, 1{1}'.format(place, direction)
+        rows = self.conn.execute(sql, [i for status in status_show for i in (status,) + params])
+        return ((row, 0, (row[0], 1)) for row in self.rows_after(rows, after))
+
+    def rows_after(self, rows, after):
+        # rows following the one with id `after`, for orders with no key to seek on
+        if after is not None:
+            for row in rows:
+                if row[0] == after[0]:
+                    break
+        yield from rows
+
+    def nested_rows(self, status_filter, sql_vars, find = None, after = None, filtered = False, full_text = True):
+        # nested notes in tree order, then circular ones, then free notes by id; only the Nest
+        # hierarchy (and the ids of --find or filtered matches) is held in memory, rows come a chunk at a time
+        id_gen, parent_children = self.family_tree()
+        walked = set(i for i, g in id_gen)
+        in_tree = walked | parent_children
+        placed = id_gen + [(i, -1) for i in sorted(parent_children - walked)]
+        listings = {} # a note nested under several parents is listed once for each
+        keys = []
+        for i, g in placed:
+            listings[i] = listings.get(i, 0) + 1
+            keys.append((i, listings[i]))
+        if find:
+            sql = "SELECT Notes.notes_id FROM NotesFTS JOIN Notes ON Notes.notes_id = NotesFTS.rowid \
+            WHERE NotesFTS MATCH ? AND " + status_filter
+            shown = set(i[0] for i in self.conn.execute(sql, (self.match_query(find),) + sql_vars))
+        elif filtered:
+            sql = "SELECT Notes.notes_id FROM Notes WHERE " + status_filter
+            shown = set(i[0] for i in self.conn.execute(sql, sql_vars))
+        else:
+            shown = None
+            status_show = set(sql_vars)
+        start = 0
+        if after is not None and after[0] in in_tree:
+            start = keys.index(after) + 1 if after in keys else len(placed)
+        elif after is not None:
+            start = len(placed)
+        for chunk in self.chunked(zip(placed[start:], keys[start:]), self.QUERY_CHUNK):
+            rows = self.query_rows([i for (i, g), key in chunk if shown is None or i in shown], full_text)
+            for (i, gen), key in chunk:
+                row = rows.get(i)
+                if row and (row[1] in status_show if shown is None else i in shown):
+                    yield row, gen, key
+
+        first_free = 0 if after is None or after[0] in in_tree else after[0]
+        if shown is not None:
+            free = sorted(i for i in shown - in_tree if i > first_free)
+            for chunk in self.chunked(free, self.QUERY_CHUNK):
+                rows = self.query_rows(chunk, full_text)
+                yield from ((rows[i], 0, (i, 1)) for i in chunk)
+        else:
+            sql = "SELECT " + self.row_columns(full_text) + " FROM Notes LEFT JOIN Status ON Notes.status_id = Status.status_id \
+            WHERE " + status_filter + " AND Notes.notes_id > ? ORDER BY Notes.notes_id"
+            for row in self.conn.execute(sql, sql_vars + (first_free,)):
+                if row[0] not in in_tree:
+                    yield row, 0, (row[0], 1)
+
+    def query_row(self, note_id):
+        sql = ''' SELECT {0} FROM Notes LEFT JOIN Status ON Notes.status_id = Status.status_id WHERE notes_id = ? '''.format(self.row_columns())
+        self.cursor.execute(sql, (note_id,))
+        row = self.cursor.fetchone()
+        return(row)
+
+    def id_array(self, note_ids):
+        # ids as one JSON array parameter for json_each: any number of them, one statement text
+        return '[' + ','.join(str(int(i)) for i in note_ids) + ']'
+
+    def query_rows(self, note_ids, full_text = True):
+        # fetch many rows at once; the ids are a single bound array joined by json_each
+        sql = ''' SELECT {0} FROM Notes LEFT JOIN Status ON Notes.status_id = Status.status_id
+            WHERE notes_id IN (SELECT value FROM json_each(?)) '''.format(self.row_columns(full_text))
+        with self.phase('rows'):
+            rows = {row[0]: row for row in self.cursor.execute(sql, (self.id_array(note_ids),))}
+        return(rows)
+
+    def identifier_to_id(self, note_id):
+        # ids, id ranges (100-250), aliases and alias globs (proj*) resolved in one query,
+        # each kind bound as a single JSON array instead of one ? per identifier. An alias
+        # that exists as typed is that note, even if it holds *, ? or [; else it is a glob
+        ids, ranges, patterns = [], [], []
+        for x in note_id:
+            x = str(x)
+            match = re.fullmatch(r'([0-9]+)(?:-([0-9]+))?', x)
+            if match and match.group(2):
+                ranges.append(sorted((int(match.group(1)), int(match.group(2)))))
+            elif match:
+                ids.append(int(x))
+            else: # the literal prefix bounds a search of the alias index, GLOB checks the rest
+                prefix = re.split(r'[*?\[]', x, 1)[0]
+                stem = prefix.rstrip('\U0010ffff') # no character follows U+10FFFF to bound it with
+                below = stem[:-1] + chr(ord(stem[-1]) + 1) if stem else None
+                patterns.append([x, prefix, below])
+        if not (ids or ranges or patterns):
+            return []
+        import json
+        # with no upper bound the range ends at X'', as text sorts below any blob
+        sql = ''' SELECT notes_id FROM Notes WHERE notes_id IN (SELECT value FROM json_each(?1))
+            UNION
+            SELECT Notes.notes_id FROM json_each(?2) AS r
+                JOIN Notes ON Notes.notes_id BETWEEN json_extract(r.value, '$[0]') AND json_extract(r.value, '$[1]')
+            UNION
+            SELECT Notes.notes_id FROM json_each(?3) AS p
+                JOIN Notes ON Notes.alias = json_extract(p.value, '$[0]')
+            UNION
+            SELECT Notes.notes_id FROM json_each(?3) AS p
+                JOIN Notes ON Notes.alias >= json_extract(p.value, '$[1]')
+                AND Notes.alias < coalesce(json_extract(p.value, '$[2]'), X'')
+                AND Notes.alias GLOB json_extract(p.value, '$[0]')
+                WHERE NOT EXISTS (SELECT 1 FROM Notes AS exact WHERE exact.alias = json_extract(p.value, '$[0]'))
+            ORDER BY 1 '''
+        self.cursor.execute(sql, (self.id_array(ids), json.dumps(ranges), json.dumps(patterns)))
+        id_list = [i[0] for i in self.cursor.fetchall()]
+        return(id_list)
+
+    def add_many(self, notes):
+        # ids of the new notes, in order. Each note is a dict with a description and optionally
+        # status (a status_id, 1 if not given), due, priority, alias, parents (note ids) and
+        # created_at (now if not given), which is also its modified_at
+        sql_seq = "SELECT coalesce(max(seq), 0) FROM sqlite_sequence WHERE name = 'Notes'"
+        sql = '''INSERT INTO Notes (description, status_id, due, priority, alias, created_at, modified_at)
+            VALUES (?1, ?2, ?3, ?4, ?5, coalesce(?6, datetime(CURRENT_TIMESTAMP, 'localtime')),
+            coalesce(?6, datetime(CURRENT_TIMESTAMP, 'localtime')))'''
+        ids = []
+        with self.transaction():
+            for chunk in self.chunked(notes, self.WRITE_CHUNK):
+                # AUTOINCREMENT hands out consecutive ids after sqlite_sequence within this write transaction
+                first_id = self.cursor.execute(sql_seq).fetchone()[0] + 1
+                self.cursor.executemany(sql, [(n.get('description'), n.get('status') or 1, n.get('due'),
+                        n.get('priority'), n.get('alias'), n.get('created_at')) for n in chunk])
+                chunk_ids = range(first_id, first_id + len(chunk))
+                self.nest_links([(parent, i) for n, i in zip(chunk, chunk_ids) for parent in n.get('parents') or ()])
+                ids.extend(chunk_ids)
+        return ids
+
+    def update_many(self, changes):
+        # number of notes changed. Each change is a dict with the note's id and any of description,
+        # status, due, priority and alias; those not given (or None) keep their value
+        modified = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+        sql = '''UPDATE Notes SET status_id = coalesce(?, status_id), due = coalesce(?, due),
+                description = coalesce(?, description), modified_at = ?, priority = coalesce(?, priority),
+                alias = coalesce(?, alias) WHERE notes_id = ?'''
+        count = 0
+        with self.transaction():
+            for chunk in self.chunked(changes, self.WRITE_CHUNK):
+                self.cursor.executemany(sql, [(c.get('status'), c.get('due'), c.get('description'), modified,
+                        c.get('priority'), c.get('alias'), c['id']) for c in chunk])
+                count += self.cursor.rowcount
+        return count
+
+    def remove_many(self, note_ids):
+        # remove notes with their links and attachments; children of a removed note are adopted
+        # by its parents. Returns (note id, [(parent, adopted child), ...]) for each note
+        sql_parents = "SELECT parent FROM Nest WHERE child = ?"
+        sql_orphans = "SELECT child FROM Nest WHERE parent = ?"
+        sql_delete_nest = "DELETE FROM Nest WHERE parent = ? OR child = ?"
+        removed = []
+        with self.transaction():
+            for note_id in note_ids:
+                parents = set(i[0] for i in self.cursor.execute(sql_parents, (note_id,)).fetchall())
+                orphans = set(i[0] for i in self.cursor.execute(sql_orphans, (note_id,)).fetchall())
+                self.cursor.execute(sql_delete_nest, (note_id, note_id))
+                if self.tree is not None:
+                    self.tree.unlink_note(note_id)
+                adopted = [(parent, orphan) for parent in parents for orphan in orphans]
+                self.nest_links(adopted)
+                removed.append((note_id, adopted))
+            sql_delete_query = "DELETE FROM Notes WHERE notes_id = ?"
+            self.cursor.executemany(sql_delete_query, [(i,) for i in note_ids])
+            self.detach_files(note_ids)
+        return removed
+
+    def set_parents(self, children, parents, replace = False):
+        # nest every child under every parent; replace first drops the children's other parents
+        with self.transaction():
+            if replace:
+                self.remove_parents(children)
+            self.nest_links([(parent, child) for child in children for parent in parents])
+
+    def remove_parents(self, children, parents = None):
+        # unlink the children from the given parents, or from all of their parents
+        with self.transaction():
+            if parents is None:
+                sql_unnest = 'DELETE FROM Nest WHERE child = ?'
+                self.cursor.executemany(sql_unnest, [(child,) for child in children])
+                if self.tree is not None:
+                    [self.tree.unlink_parents(child) for child in children]
+            else:
+                links = [(parent, child) for child in children for parent in parents]
+                sql_unnest = 'DELETE FROM Nest WHERE parent = ? and child = ?'
+                self.cursor.executemany(sql_unnest, links)
+                if self.tree is not None:
+                    [self.tree.unlink(parent, child) for parent, child in links]
+
+    def nest_links(self, links):
+        # add (parent, child) links to Nest and to the tree when it is loaded
+        sql_nest = 'INSERT INTO Nest (parent, child) VALUES (?, ?)'
+        self.cursor.executemany(sql_nest, links)
+        if self.tree is not None:
+            [self.tree.link(parent, child) for parent, child in links]
+
+    def iter_notes(self, status = (1,2,3,4,5), nested = False, find = None, regex = None, sort = None, due = None, full_text = True):
+        # rows laid out as ROW_COLUMNS, read a chunk at a time as they are consumed: by id, in
+        # tree order when nested, or as --sort, --agenda and --overdue order them (see note_rows)
+        rows = self.note_rows('nested' if nested else 'flat', status, find, None, regex, full_text, sort, due)
+        return (row for row, gen, key in rows)
+
+    def db_id(self):
+        # names this database in the change records it exports, so a copy knows what it has applied
+        return self.cursor.execute("SELECT value FROM DbInfo WHERE name = 'db_id'").fetchone()[0]
+
+    def new_db_id(self):
+        # a copy of the database file is the same database to the others until it has its own db_id.
+        # The copy holds the original's rows through its last journal entry, so that much is
+        # recorded as applied from it. Returns the new db_id
+        with self.transaction():
+            old = self.db_id()
+            sql_last = "SELECT coalesce(max(seq), 0) FROM sqlite_sequence WHERE name = 'Changes'"
+            through = self.cursor.execute(sql_last).fetchone()[0]
+            self.cursor.execute("UPDATE DbInfo SET value = lower(hex(randomblob(16))) WHERE name = 'db_id'")
+            self.cursor.execute('INSERT OR IGNORE INTO ChangesSeen (db_id, seq) VALUES (?, 0)', (old,))
+            self.cursor.execute('UPDATE ChangesSeen SET seq = max(seq, ?) WHERE db_id = ?', (through, old))
+            return self.db_id()
+
+    def changes_since(self, since = 0):
+        # a header, then {seq, table, id, row} for every row written after seq `since`, at its latest
+        # seq and in seq order; row is its current columns, or None once it was deleted. Read in
+        # one snapshot so the header's `through` is exactly what the records cover
+        with self.transaction(write = False):
+            through = self.cursor.execute('SELECT coalesce(max(seq), 0) FROM Changes').fetchone()[0]
+            yield {'db_id': self.db_id(), 'since': since, 'through': through}
+            sql_changed = 'SELECT max(seq), tbl, row_id FROM Changes WHERE seq > ? GROUP BY tbl, row_id ORDER BY 1'
+            for chunk in self.chunked(self.conn.execute(sql_changed, (since,)), self.QUERY_CHUNK):
+                rows = {}
+                for table in set(tbl for seq, tbl, row_id in chunk):
+                    key, columns = self.SYNC_TABLES[table]
+                    sql = 'SELECT {0} FROM {1} WHERE {2} IN (SELECT value FROM json_each(?))'.format(
+                            ', '.join(columns), table, key)
+                    ids = self.id_array(row_id for seq, tbl, row_id in chunk if tbl == table)
+                    rows.update(((table, row[0]), dict(zip(columns, row))) for row in self.cursor.execute(sql, (ids,)))
+                for seq, tbl, row_id in chunk:
+                    yield {'seq': seq, 'table': tbl, 'id': row_id, 'row': rows.get((tbl, row_id))}
+
+    def apply_changes(self, records):
+        # apply what changes_since exported from another database: each row is written as it was
+        # there or deleted, so applying a record twice changes nothing. Records at or below the
+        # seq already applied from that database are skipped. Returns (applied, skipped)
+        records = iter(records)
+        header = next(records, None)
+        if not header or 'db_id' not in header:
+            raise ValueError('not a --sync-export file: the first line must be its header')
+        if header['db_id'] == self.db_id():
+            raise ValueError('these changes were exported from this database, or from the one it is a '
+                    'file copy of: run --sync-reid on the copy first')
+        applied = skipped = 0
+        with self.transaction():
+            sql_seen = 'SELECT seq FROM ChangesSeen WHERE db_id = ?'
+            seen = (self.cursor.execute(sql_seen, (header['db_id'],)).fetchone() or (0,))[0]
+            # consecutive records for the same table and kind of write go in one executemany
+            for (table, deleted), group in itertools.groupby(records, lambda r: (r['table'], r['row'] is None)):
+                group = list(group)
+                todo = [r for r in group if r['seq'] > seen]
+                skipped += len(group) - len(todo)
+                applied += len(todo)
+                if todo:
+                    self.apply_rows(table, deleted, todo)
+            self.cursor.execute('INSERT OR IGNORE INTO ChangesSeen (db_id, seq) VALUES (?, 0)', (header['db_id'],))
+            sql_mark = 'UPDATE ChangesSeen SET seq = max(seq, ?) WHERE db_id = ?'
+            self.cursor.execute(sql_mark, (header['through'], header['db_id']))
+            self.tree = None
+        return applied, skipped
+
+    def apply_rows(self, table, deleted, records):
+        # write (or delete) one table's rows from change records; ids are kept as they were exported
+        if table not in self.SYNC_TABLES:
+            raise ValueError('not a journaled table: ' + str(table))
+        key, columns = self.SYNC_TABLES[table]
+        if deleted:
+            ids = [r['id'] for r in records]
+            self.cursor.execute('DELETE FROM {0} WHERE {1} IN (SELECT value FROM json_each(?))'.format(table, key),
+                    (self.id_array(ids),))
+            if table == 'Notes':
+                self.detach_files(ids)
+            return
+        values = [[r['row'].get(c) for c in columns] for r in records]
+        if table == 'Notes':
+            # the records are one snapshot of the other database, so an alias they give is free there;
+            # a note here still holding it has its own record later in the export, or lost it
+            aliased = [(v[7], v[0]) for v in values if v[7] is not None]
+            self.cursor.executemany('UPDATE Notes SET alias = NULL WHERE alias = ? AND notes_id != ?', aliased)
+            # notes already here are updated, the rest inserted; no UPSERT, which needs sqlite 3.24
+            sql_have = 'SELECT notes_id FROM Notes WHERE notes_id IN (SELECT value FROM json_each(?))'
+            have = set(i[0] for i in self.cursor.execute(sql_have, (self.id_array(v[0] for v in values),)))
+            sql_update = 'UPDATE Notes SET {0} WHERE notes_id = ?'.format(', '.join(c + ' = ?' for c in columns[1:]))
+            self.cursor.executemany(sql_update, [v[1:] + v[:1] for v in values if v[0] in have])
+            values = [v for v in values if v[0] not in have]
+            sql = 'INSERT INTO Notes ({0}) VALUES ({1})'.format(', '.join(columns), ', '.join('?' * len(columns)))
+        elif table == 'Nest': # links are only ever added and removed, never changed
+            sql = 'INSERT OR IGNORE INTO Nest (nest_id, parent, child) VALUES (?, ?, ?)'
+        else:
+            sql = 'INSERT OR REPLACE INTO Alias (rowid, notes_id, alias) VALUES (?, ?, ?)'
+        self.cursor.executemany(sql, values)
+
+    def compact_changes(self, every = 0):
+        # keep only each row's latest journal entry, which is all an export sends; once at least
+        # `every` entries were written since the last compaction. Returns the entries dropped
+        sql_last = "SELECT coalesce(max(seq), 0) FROM sqlite_sequence WHERE name = 'Changes'"
+        last = self.cursor.execute(sql_last).fetchone()[0]
+        sql_compacted = "SELECT coalesce(max(value), 0) FROM DbInfo WHERE name = 'compacted_seq'"
+        if last - int(self.cursor.execute(sql_compacted).fetchone()[0]) < max(every, 1):
+            return 0
+        with self.transaction():
+            sql = '''DELETE FROM Changes WHERE EXISTS (SELECT 1 FROM Changes AS later
+                WHERE later.tbl = Changes.tbl AND later.row_id = Changes.row_id AND later.seq > Changes.seq)'''
+            dropped = self.cursor.execute(sql).rowcount
+            self.cursor.execute("INSERT OR REPLACE INTO DbInfo (name, value) VALUES ('compacted_seq', ?)", (last,))
+        return dropped
+
+    def detach_files(self, note_ids):
+        # drop the notes' attachments and any content no other note still refers to
+        sql_files = "SELECT DISTINCT sha256 FROM NoteFiler WHERE notes_id = ?"
+        shas = set(i[0] for note_id in note_ids for i in self.cursor.execute(sql_files, (note_id,)).fetchall())
+        self.cursor.executemany("DELETE FROM NoteFiler WHERE notes_id = ?", [(i,) for i in note_ids])
+        sql_orphan = ''' DELETE FROM Files WHERE sha256 = ?
+            AND NOT EXISTS (SELECT 1 FROM NoteFiler WHERE NoteFiler.sha256 = ?) '''
+        self.cursor.executemany(sql_orphan, [(sha, sha) for sha in shas])
+
+    def store_file(self, path):
+        # (file_id of part 0, sha256, whether new content was written); the file is
+        # hashed first so known content is never copied, then streamed in FILE_CHUNK
+        # steps into FILE_PART sized rows through incremental blob I/O (without BLOB_IO,
+        # into FILE_CHUNK sized rows, each written as one bound parameter)
+        import hashlib
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.FILE_CHUNK), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        sha = digest.hexdigest()
+        sql_known = 'SELECT file_id FROM Files WHERE sha256 = ? AND part = 0'
+        known = self.cursor.execute(sql_known, (sha,)).fetchone()
+        if known:
+            return known[0], sha, False
+        sql_part = 'INSERT INTO Files (file, sha256, part) VALUES (zeroblob(?), ?, ?)'
+        sql_chunk = 'INSERT INTO Files (file, sha256, part) VALUES (?, ?, ?)'
+        part_size = self.FILE_PART if self.BLOB_IO else self.FILE_CHUNK
+        check = hashlib.sha256()
+        file_id = None
+        with open(path, 'rb') as f:
+            for part, start in enumerate(range(0, max(size, 1), part_size)):
+                length = min(part_size, size - start)
+                if not self.BLOB_IO:
+                    chunk = f.read(length)
+                    check.update(chunk)
+                    self.cursor.execute(sql_chunk, (chunk, sha, part))
+                    file_id = file_id or self.cursor.lastrowid
+                    continue
+                self.cursor.execute(sql_part, (length, sha, part))
+                file_id = file_id or self.cursor.lastrowid
+                with self.conn.blobopen('Files', 'file', self.cursor.lastrowid) as blob:
+                    while blob.tell() < length:
+                        chunk = f.read(min(self.FILE_CHUNK, length - blob.tell()))
+                        if not chunk:
+                            break
+                        check.update(chunk)
+                        blob.write(chunk)
+        if check.hexdigest() != sha:
+            sys.exit('File changed while attaching: ' + str(path))
+        return file_id, sha, True
+
+    def file_chunks(self, file_id):
+        # one Files row's content in FILE_CHUNK pieces, through blob I/O or, without BLOB_IO, substr()
+        if self.BLOB_IO:
+            with self.conn.blobopen('Files', 'file', file_id, readonly=True) as blob:
+                yield from iter(lambda: blob.read(self.FILE_CHUNK), b'')
+            return
+        sql = 'SELECT substr(file, ?, ?) FROM Files WHERE file_id = ?'
+        start = 1
+        while True:
+            chunk = self.conn.execute(sql, (start, self.FILE_CHUNK, file_id)).fetchone()[0]
+            if not chunk:
+                break
+            yield chunk
+            start += len(chunk)
+
+    def chunked(self, iterable, size):
+        iterator = iter(iterable)
+        chunk = list(itertools.islice(iterator, size))
+        while chunk:
+            yield chunk
+            chunk = list(itertools.islice(iterator, size))
+
+
+class Jot(JotStore):
+    """
+    The jot command line: parses the arguments, reads ~/.jot/config.csv,
+    then runs the command against its JotStore and prints the result.
+    """
+    # column order of --export files; --import accepts any subset by name
+    EXPORT_FIELDS = ['id', 'parents', 'status', 'due', 'priority', 'alias', 'created_at', 'modified_at', 'description']
+    IMPORT_CHUNK = 5000 # notes inserted and committed per batch by --import
+    SOCKET_NAME = 'jot.sock' # unix socket under ~/.jot that `jot --serve` listens on
+    CLIENT_TIMEOUT = 1 # seconds `jot --serve` waits on a client's request or its reading the reply
+    ACROSS_SCHEMA = 'across{0:d}' # schema the nth database named by --across is attached as
+
+    def __init__(self, **kwargs):
+        self.parser = None
+        self.profiler = None
         self.parse_inputs()
-        self.main()
+        if self.args.profile or os.environ.get('JOT_TRACE', '0') not in ('', '0'):
+            self.profiler = Profiler()
+        try:
+            with self.phase('config'):
+                self.read_config()
+            if self.args.spool:
+                self.spool_args()
+                return
+            with self.phase('connect'):
+                super().__init__(self.DB, self.pragmas, self.profiler)
+            if self.args.serve:
+                self.serve()
+            else:
+                self.main()
+        finally:
+            if self.profiler:
+                self.profiler.report()
+                slow_ms = self.config.get('slow_query_ms', '100') if hasattr(self, 'config') else ''
+                if slow_ms:
+                    self.profiler.slow_log = (self.JOT_DIR / 'slow_queries.log', float(slow_ms) / 1000)
+                    self.profiler.log_slow(' '.join(sys.argv[1:]))
+
+    def notice(self, message):
+        # on the command line these are part of the output, as they always were
+        print(message)
 
     def read_config(self):
         # Define jot dir under home directory
@@ -41,27 +1156,12 @@ class Jot:
         else:
             p = def_conf
 
-        d = {}
-        with open(p, newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                d[row['name']] = row['value'].strip()
+        d = self.load_config(p)
         self.config = d
 
         if p == def_conf:
             self.config['db_dir'] = self.JOT_DIR
             self.write_config(self.config)
-            # TODO DELETE IN LATER VERSION--TO MIGRATE existing.sqlites to dat location
-            sourcefiles = os.listdir(self.SRC_DIR)
-            destinationpath = self.JOT_DIR
-            for file in sourcefiles:
-                if file.endswith('.sqlite'):
-                    shutil.move(self.SRC_DIR / file, self.JOT_DIR / file)
-            sourcefiles = os.listdir(self.SRC_DIR / 'dat')
-            destinationpath = self.JOT_DIR
-            for file in sourcefiles:
-                if file.endswith('.sqlite'):
-                    shutil.move(self.SRC_DIR / 'dat' / file, self.JOT_DIR / file)
 
         self.snippet_width = int(d['snippet_width']) # notes column print width
         self.DB_NAME = d['db_name']
@@ -74,12 +1174,12 @@ class Jot:
                 d['color_default'], d['color_text']]
 
         #### windows config
-        if platform.system() == 'Windows':
+        if sys.platform == 'win32':
             self.EDITOR = d['win_editor']
             self.colorize = d['win_colorize'] == "True"
             self.view_note_cmd = d['win_view_cmd']
         #### macos
-        elif platform.system() == "Darwin":
+        elif sys.platform == 'darwin':
             self.EDITOR = d['mac_editor']
             self.colorize = d['mac_editor'] == "True"
             self.view_note_cmd = d['mac_view_cmd']
@@ -88,40 +1188,59 @@ class Jot:
             self.EDITOR = d['unix_editor']
             self.colorize = d['unix_colorize'] == "True"
             self.view_note_cmd = d['unix_view_cmd']
+        self.pragmas = {name: d.get(name, default) for name, default in self.PRAGMA_DEFAULTS.items()}
+        self.renderer = Renderer(self.palette, self.snippet_width, self.colorize)
         return(d)
 
+    def load_config(self, path):
+        # the parsed csv is cached in config.cache, keyed on the csv's path, mtime and size
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        self.config_key = key
+        cache = self.JOT_DIR / 'config.cache'
+        try:
+            with open(cache, 'rb') as f:
+                cached_key, d = marshal.load(f)
+            if cached_key == key:
+                return d
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+        import csv
+        d = {}
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                d[row['name']] = row['value'].strip()
+        with open(cache, 'wb') as f:
+            marshal.dump((key, d), f)
+        return d
+
     def write_config(self, config):
         conf_list = []
         for key, val in config.items():
             conf_list.append({'name': key, 'value': val})
         fields = ['name', 'value']
 
+        import csv
         with open(self.JOT_DIR / 'config.csv', 'w') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames = fields)
             writer.writeheader()
             writer.writerows(conf_list)
 
-    def style_parser(self, color = 15, style = 0):
-        return '\x1b[' + str(style) + ';38;5;' + str(color) + 'm'
-
     def connect(self):
-        undefined_db = not self.DB.exists()
-        if undefined_db:
-            print(f"creating new database: {self.DB}")
-            self.conn = sqlite3.connect(self.DB)
-            self.cursor = self.conn.cursor()
-            sql_file = open(self.SRC_DIR / "create_db.sql")
-            sql_as_string = sql_file.read()
-            self.cursor.executescript(sql_as_string)
-            self.conn.commit()
-        else:
-            try:
-                self.conn = sqlite3.connect(self.DB)
-                self.cursor = self.conn.cursor()
-            # RSD TODO: Should explicitly catch exceptions
-            except:
-                print ('attempting to connect to ' + str(self.JOT_DIR))
-                sys.exit("Connection to sqlite db failed!")
+        if not self.DB.exists():
+            self.migrate_legacy_dbs()
+        super().connect()
+
+    def migrate_legacy_dbs(self):
+        # TODO DELETE IN LATER VERSION--older versions kept databases in the source tree
+        import shutil
+        for src in (self.SRC_DIR, self.SRC_DIR / 'dat'):
+            if src.is_dir():
+                for file in os.listdir(src):
+                    if file.endswith('.sqlite'):
+                        shutil.move(src / file, self.JOT_DIR / file)
 
     def set_db_dir(self, path):
         if os.path.exists(path):
@@ -139,236 +1258,467 @@ class Jot:
         self.write_config(self.config)
         self.read_config()
 
-    def flatten2set(self, object):
-        gather = []
-        for item in object:
-            if isinstance(item, (list, tuple, set)):
-                gather.extend(self.flatten2set(item))
-            else:
-                gather.append(item)
-        return set(gather)
-
-    def flatten2list(self, object):
-        gather = []
-        for item in object:
-            if isinstance(item, (list, tuple, set)):
-                gather.extend(self.flatten2list(item))
-            else:
-                gather.append(item)
-        return list(gather)
-
-    def gen_symbol(self, gen):
-        if gen == 0:
-            return ['']
-        elif gen == 1:
-            return ['>'.ljust(gen, '>') + ' ']
-        elif gen > 1:
-            return ['>'.rjust(gen, '-') + ' ']
-        elif gen == -1:
-            return ['? ']
-
-    def smart_wrap(self, text, width):
-        text_list = text.split('\n')
-        if not isinstance(text_list, list):
-            text_list = [text_list]
-        wrap = []
-        for line in text_list:
-            indent = len(line) - len(line.lstrip())
-            n = width - indent
-            line = line[indent:]
-            wrap.append('\n'.join([(''.ljust(indent if i == 0 else indent + 2) + line[i:i+n]) for i in range(0, len(line), n)]))
-        return '\n'.join(wrap)
+    def write_lines(self, lines):
+        # one buffered write instead of a print per line
+        if lines:
+            sys.stdout.write('\n'.join(lines) + '\n')
 
     def print_formatted(self, row, gen = 0, find = None, full = False):
-        result = self.summary_formatted(row, gen = gen)
-        if result:
-            print(result)
-            if full:
-                if len(row[3]) > self.snippet_width:
-                    if self.colorize:
-                        [print(self.style_parser(self.palette[0], 0) + '| ' + \
-                            self.style_parser(self.palette[8], 0) + i.ljust(self.snippet_width + 20) + \
-                            self.style_parser(self.palette[0], 0) + '|')
-                            for i in self.smart_wrap(row[3], width = self.snippet_width + 20).split('\n')]
-                    else:
-                        [print('| ' + i.ljust(self.snippet_width + 20) + '|')
-                            for i in self.smart_wrap(row[3], width = self.snippet_width + 20).split('\n')]
-                print(self.note_line())
-
-            if find:
-                wid = self.snippet_width - len(find)
-                widh1 = math.ceil(wid/2)
-                widh2 = math.floor(wid/2)
-                snip = [i for i in row[3].lower().split('\n') if i.find(self.args.find.lower())>=0]
-                for line in snip:
-                    context = ('~' + line + '~').split(find.lower())
-                    if len(line) > wid:
-                        context = ('~' + line + '~').split(find.lower())
-                        context_wid = [len(i) for i in context][0:2]
-                        if sum(context_wid) > wid:
-                            if context_wid[0] > widh1 and context_wid[1] > widh2:
-                                line = context[0][-widh1:] + find.upper() + context[1][:widh2]
-                            elif context_wid[0] > widh1:
-                                line = context[0][-(wid-context_wid[1]):] + find.upper() + context[1]
-                            else:
-                                line = context[0] + find.upper() + context[1][:wid-context_wid[0]]
-                    else:
-                        line = context[0] + find.upper() + context[1]
-                    print(self.colorize_summary('|                     ' + line.ljust(self.snippet_width) + '|'))
+        self.write_lines(self.renderer.note_lines(row, gen, find, full))
 
     def summary_formatted(self, row, gen = 0):
-        gen_parts = self.gen_symbol(gen)
-        sts_str = (row[9] if row[9] else '').center(3, '|')
-        gen_str = gen_parts[0]
-
-        idWidth = 5
-        sym_len = 0
-        multiline = '\n' in row[3]
-        note_summary = gen_str + row[3].split('\n')[0]
-        nslen0 = len(note_summary)
-        tooLong = nslen0 > self.snippet_width
-        chr_key = ['|', '~', 'v', '&']
-        if tooLong and multiline:
-            end_chr = 3
-        elif tooLong: # and not multiline
-            end_chr = 1
-        elif multiline: # and not too long
-            end_chr = 2
-        else:
-            end_chr = 0
-        note_summary = note_summary[:self.snippet_width].ljust(self.snippet_width) + chr_key[end_chr]
-        due_str = (row[2] if row[2] else '').center(10)
-        id_str = row[7][:idWidth].rjust(idWidth) if row[7] else str(row[0]).rjust(idWidth)
-        note_str = note_summary
-        plain_summary = '| ' + due_str + ' ' + sts_str + '' + id_str + ' ' + note_str + ' '
-        return(self.colorize_summary(plain_summary, gen, row[8], end_chr))
-
-    def colorize_summary(self, my_str, gen = 0, status_id = 0, trim_key = 0):
-        if self.colorize:
-            palette = self.palette
-            note_col = palette[0:6]
-            sty = {}
-            sty[0] = self.style_parser(palette[7], 0)
-            sty['ind'] = self.style_parser(palette[0] if status_id == 0 else palette[6], 3)
-            sty['note'] = self.style_parser(note_col[status_id], 0)
-            sty['end'] = self.style_parser(palette[0], 0 if trim_key == 0 else 5)
-            sty['date'] = sty['note']
-            sty['stat'] = sty['note']
-            mydate = sty['date'] + my_str[1:13]
-            mystat = sty['stat'] + my_str[13:16]
-            myind = sty['ind'] + my_str[16:22]
-            gen_start = 22
-            gen_stop = 22 + abs(gen)
-            mygen = sty['ind'] + my_str[gen_start:gen_stop]
-            mynote = sty['note'] + my_str[gen_stop:22+self.snippet_width]
-            myend = sty['end'] + my_str[22+self.snippet_width:23+self.snippet_width] + sty[0]
-            return(sty['end'] + my_str[0:1] + mydate + mystat + myind + mygen + mynote + myend)
-        else:
-            return(my_str)
-
-    def search_notes(self, term):
-        sql = ''' SELECT notes_id FROM Notes WHERE description LIKE ? '''
-        found_id = self.cursor.execute(sql, ('%' + term + '%',)).fetchall()
-        found_id = [tuple([i[0] for i in found_id])][0] # list of tuples to tuple for sqlite input format
-        return found_id
-
-    def find_children(self, parent, gen):
-        sql = ''' SELECT child FROM Nest WHERE parent = ? '''
-        children = list(sum(self.cursor.execute(sql, (parent,)).fetchall(), ()))
-        nest = [parent, gen, [self.find_children(child, gen+1) for child in children]]
-        return nest
+        return self.renderer.summary_formatted(row, gen)
+
+    def valid_find(self, s):
+        # reject what fts5 would: operators need a term on both sides, parentheses must pair
+        expect_term, depth = True, 0
+        for kind, text in self.find_tokens(s):
+            if text == '(':
+                depth += 1
+                expect_term = True
+            elif text == ')':
+                if expect_term or not depth:
+                    raise argparse.ArgumentTypeError("unmatched or empty parentheses: {0!r}".format(s))
+                depth -= 1
+            elif kind == 'operator':
+                if expect_term:
+                    raise argparse.ArgumentTypeError("{0} needs a term before and after it: {1!r}".format(text, s))
+                expect_term = True
+            else:
+                expect_term = False
+        if depth or expect_term:
+            raise argparse.ArgumentTypeError("incomplete find term: {0!r}".format(s))
+        return s
 
-    def family_tree(self):
-        sql_parents = ' SELECT parent FROM Nest '
-        sql_children = ' SELECT child FROM Nest '
-        parents = self.flatten2set(self.cursor.execute(sql_parents).fetchall())
-        children = self.flatten2set(self.cursor.execute(sql_children).fetchall())
-        last_children = children - parents
-        parent_children = children - last_children
-        first_parents = list(parents - parent_children)
-        first_parents.sort()
-        tree = list([self.find_children(parents, 1) for parents in first_parents])
-        return tree, parent_children
+    def valid_regex(self, s):
+        try:
+            compiled_pattern(s)
+        except re.error as e:
+            raise argparse.ArgumentTypeError("not a regular expression: {0!r} ({1})".format(s, e))
+        return s
+
+    def find_pattern(self, find = None, regex = None):
+        # one pattern for everything --find and --regex matched, so each row's snippets come from
+        # a single pass over its text; what NOT excludes is not marked
+        parts = [regex] if regex else []
+        depth, negate, negated = 0, False, None
+        for kind, text in self.find_tokens(find or ''):
+            if text == '(':
+                if negate and negated is None:
+                    negated = depth
+                depth += 1
+                negate = False
+            elif text == ')':
+                depth -= 1
+                if negated == depth:
+                    negated = None
+            elif text == 'NOT':
+                negate = True
+            elif kind != 'operator':
+                if not negate and negated is None:
+                    words = [re.escape(i) for i in re.findall(r'\w+', text)]
+                    if words:
+                        parts.append(r'(?i:\b' + r'\W+'.join(words) + (r'\w*)' if kind == 'word' else r'\b)'))
+                negate = False
+        return re.compile('|'.join(parts)) if parts else None
 
     def note_line(self):
-        return self.colorize_summary('+------------+-+-----+' + ''.ljust(self.snippet_width, '-') + '+')
+        return self.renderer.line
 
     def note_header(self):
-        return self.colorize_summary('|     Date   |?|  ID   Note ' + str(self.DB).rjust(self.snippet_width-7) + ' |')
-
-    def nest_notes(self, my_ids):
-        # calculate nesting of items
-        tree, parent_children = self.family_tree()
-        id_gen = self.flatten2list(tree)
-        # filter nested items
-        id_gen = [[i, g] for i, g in zip(id_gen[::2], id_gen[1::2]) if i in my_ids]
-        id_gen = self.flatten2list(id_gen)
-        ids = id_gen[::2]
-        gens = id_gen[1::2]
-        # add unresolved nested items that are in my_ids
-        circular = parent_children - set(ids) & set(my_ids)
-        circular = list(circular)
-        circular.sort()
-        ids.extend(circular)
-        gens.extend([-1] * len(circular))
-        # add free items that are in my_ids
-        free = set(my_ids) - set(ids)
-        free = list(free)
-        free.sort()
-        ids.extend(free)
-        gens.extend([0] * len(free))
-        return ids, gens
+        return self.renderer.header(self.DB)
 
-    def print_nested(self, my_ids, find, full=False):
+    def nested_lines(self, my_ids, find, full=False, rows=None):
         ids, gens = self.nest_notes(my_ids)
-        [self.print_formatted(self.query_row(i), g, find, full) for i, g in zip(ids, gens)]
+        rows = rows if rows is not None else self.query_rows(ids, bool(find or full))
+        if not find and not full:
+            return self.renderer.summary_rows([rows.get(i) for i in ids], gens)
+        note_lines = self.renderer.note_lines
+        return [line for i, g in zip(ids, gens) for line in note_lines(rows.get(i), g, find, full)]
 
-    def print_flat(self, my_ids, find, full=False):
+    def flat_lines(self, my_ids, find, full=False, rows=None):
         my_ids = my_ids if isinstance(my_ids, list) else [my_ids]
-        [self.print_formatted(self.query_row(i), 0, find, full) for i in my_ids]
-
-    def print_notes(self, mode = 'nested', status_show = (1,2,3,4,5), find = None, full = False):
-        sql = "SELECT notes_id FROM Notes \
-        WHERE status_id IN ({seq})".format(seq=','.join(['?']*len(status_show)))
-        sql_vars = status_show
-
-        # filter on search term if provided
-        if find:
-            found = self.search_notes(find)
-            if found is not None:
-                sql = sql + " AND notes_id IN ({nid})".format(nid=','.join(['?']*len(found)))
-                sql_vars = sql_vars + found
-
-        my_ids = list(sum(self.cursor.execute(sql, sql_vars).fetchall(), ()))
-        print(self.note_line() + '\n' + self.note_header() + '\n' + self.note_line())
-        if mode == 'flat':
-            self.print_flat(my_ids, find, full)
-        elif mode == 'nested':
-            self.print_nested(my_ids, find, full)
-        print(self.note_line())
+        rows = rows if rows is not None else self.query_rows(my_ids, bool(find or full))
+        if not find and not full:
+            return self.renderer.summary_rows([rows.get(i) for i in my_ids], [0] * len(my_ids))
+        note_lines = self.renderer.note_lines
+        return [line for i in my_ids for line in note_lines(rows.get(i), 0, find, full)]
+
+    def print_nested(self, my_ids, find, full=False, rows=None):
+        self.write_lines(self.nested_lines(my_ids, find, full, rows))
+
+    def print_flat(self, my_ids, find, full=False, rows=None):
+        self.write_lines(self.flat_lines(my_ids, find, full, rows))
+
+    def print_notes(self, mode = 'nested', status_show = (1,2,3,4,5), find = None, full = False, limit = None, after = None, pager = False, regex = None, sort = None, due = None):
+        lines = self.summary_lines(mode, status_show, find, full, limit, after, regex, sort, due)
+        if pager:
+            self.page_lines(lines)
+        else:
+            for chunk in self.chunked(lines, self.QUERY_CHUNK):
+                self.write_lines(chunk)
+
+    def summary_lines(self, mode, status_show, find = None, full = False, limit = None, after = None, regex = None, sort = None, due = None):
+        # the summary table as it is produced: rows are fetched and rendered a chunk at a time,
+        # so the first lines cost the same on any size of database
+        yield self.note_line()
+        yield self.note_header()
+        yield self.note_line()
+        pattern = self.find_pattern(find, regex)
+        rows = self.note_rows(mode, status_show, find, after, regex, bool(pattern or full), sort, due)
+        shown = rows if limit is None else itertools.islice(rows, limit)
+        note_lines = self.renderer.note_lines
+        last = None
+        for chunk in self.chunked(shown, self.QUERY_CHUNK):
+            if not pattern and not full:
+                yield from self.renderer.summary_rows([row for row, gen, key in chunk], [gen for row, gen, key in chunk])
+            else:
+                for row, gen, key in chunk:
+                    yield from note_lines(row, gen, pattern, full)
+            last = chunk[-1][2]
+        yield self.note_line()
+        if limit is not None and last is not None and next(rows, None) is not None:
+            key = str(last[0]) if last[1] == 1 else '{0}/{1}'.format(*last)
+            yield 'more: add --after ' + key + ' for the next ' + str(limit)
+
+    def watch(self, interval, mode, status_show, sort = None, due = None):
+        # --watch: keep one screen of the summary up, redrawing only lines that changed. A tick
+        # reads PRAGMA data_version; after a commit elsewhere the Changes journal names the rows
+        # written. Notes on screen that stay on screen are re-rendered from their own rows; new,
+        # removed or hidden notes, links and --sort/--agenda order lay the page out again
+        import shutil
+        size = shutil.get_terminal_size()
+        screen = []
+        new, placed = self.watch_page(size.lines, mode, status_show, sort, due)
+        seq = self.cursor.execute('SELECT coalesce(max(seq), 0) FROM Changes').fetchone()[0]
+        version = self.cursor.execute('PRAGMA data_version').fetchone()[0]
+        sys.stdout.write('\x1b[?25l\x1b[H\x1b[2J')
+        try:
+            while True:
+                screen = self.redraw(screen, new)
+                while True:
+                    time.sleep(interval)
+                    drained = False
+                    if self.spool_pending():
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            drained = bool(self.drain_spool())
+                    resized = shutil.get_terminal_size() != size
+                    last = self.cursor.execute('PRAGMA data_version').fetchone()[0]
+                    if drained or resized or last != version:
+                        break
+                size, version = shutil.get_terminal_size(), last
+                sql_changed = 'SELECT tbl, row_id, seq FROM Changes WHERE seq > ? ORDER BY seq'
+                changed = self.cursor.execute(sql_changed, (seq,)).fetchall()
+                seq = changed[-1][2] if changed else seq
+                notes = set(i for tbl, i, s in changed if tbl == 'Notes')
+                rows = self.query_rows(notes, full_text=False) if notes else {}
+                relinked = any(tbl == 'Nest' for tbl, i, s in changed)
+                if relinked:
+                    self.tree = None
+                if (resized or relinked or sort or due
+                        or any(i not in placed or i not in rows or rows[i][1] not in status_show for i in notes)):
+                    new, placed = self.watch_page(size.lines, mode, status_show, sort, due)
+                else:
+                    new = list(screen)
+                    for i in notes:
+                        for n, gen in placed[i]:
+                            new[n], = self.renderer.summary_rows([rows[i]], [gen])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sys.stdout.write('\x1b[{0:d};1H\x1b[?25h\n'.format(len(screen)))
+            sys.stdout.flush()
+
+    def watch_page(self, height, mode, status_show, sort, due):
+        # the summary lines that fit in height, and the screen lines (with gen) of each note
+        rows = self.note_rows(mode, status_show, None, None, None, False, sort, due)
+        shown = list(itertools.islice(rows, max(height - 5, 0)))
+        rows.close() # ends the statement, and with it the read transaction
+        lines = [self.note_line(), self.note_header(), self.note_line()]
+        lines.extend(self.renderer.summary_rows([row for row, gen, key in shown], [gen for row, gen, key in shown]))
+        lines.append(self.note_line())
+        placed = {}
+        for n, (row, gen, key) in enumerate(shown, start=3):
+            placed.setdefault(row[0], []).append((n, gen))
+        return lines, placed
+
+    def redraw(self, screen, lines):
+        # move to each line that differs from what is on screen and rewrite it; clear what is left below
+        out = ['\x1b[{0:d};1H{1}\x1b[K'.format(n + 1, line) for n, line in enumerate(lines)
+                if n >= len(screen) or screen[n] != line]
+        if len(lines) < len(screen):
+            out.append('\x1b[{0:d};1H\x1b[J'.format(len(lines) + 1))
+        sys.stdout.write(''.join(out))
+        sys.stdout.flush()
+        return lines
+
+    def valid_after(self, s):
+        # ID, or ID/N for the Nth listing of a note nested under several parents
+        match = re.fullmatch(r'([0-9]+)(?:/([1-9][0-9]*))?', s)
+        if not match:
+            raise argparse.ArgumentTypeError("not a note id or id/n: {0!r}".format(s))
+        return int(match.group(1)), int(match.group(2) or 1)
+
+    def due_range(self, agenda = None, overdue = False):
+        # [from, to) of due dates: the next `agenda` days from today, and/or anything before today
+        today = datetime.now().date()
+        end = today + timedelta(days=agenda + 1) if agenda is not None else today
+        return ('' if overdue else today.isoformat(), end.isoformat())
+
+    def archive_path(self):
+        # closed notes moved out by --archive live next to the database, in <name>.archive.sqlite
+        return Path(self.DB).with_name(Path(self.DB).stem + '.archive.sqlite')
+
+    def archive_notes(self, older_than = 0):
+        # move closed notes not modified in older_than days, with their links and attachments,
+        # into the archive. A note stays while anything nested under it is still open, so the
+        # hierarchy of open notes is never cut. With main in WAL mode a commit across attached
+        # databases is not atomic, so the move is two: the copy is committed to the archive first,
+        # then the notes are removed here. A crash between leaves them in both, and the next
+        # --archive, which replaces whatever the archive holds of the notes it copies, finishes it
+        path = self.archive_path()
+        if not path.exists():
+            with contextlib.closing(sqlite3.connect(path)) as conn:
+                self.create_schema(conn.cursor())
+        sql_closed = ''' SELECT notes_id FROM Notes WHERE status_id IN (3, 4) AND modified_at <= datetime('now', 'localtime', ?)
+            AND NOT EXISTS (SELECT 1 FROM NestClosure JOIN Notes AS below ON below.notes_id = NestClosure.descendant
+                WHERE NestClosure.ancestor = Notes.notes_id
+                AND (below.status_id NOT IN (3, 4) OR below.modified_at > datetime('now', 'localtime', ?))) '''
+        days = '-{0:d} days'.format(older_than)
+        with self.attached([str(path)]) as dbs:
+            archive = dbs[0][0]
+            with self.transaction():
+                note_ids = [i[0] for i in self.cursor.execute(sql_closed, (days, days)).fetchall()]
+                ids = self.id_array(note_ids)
+                self.clear_archived(archive, ids)
+                # ids are never reused, so notes keep theirs; an alias already taken in the archive is dropped
+                sql_notes = ''' INSERT INTO {0}.Notes (notes_id, status_id, due, description, created_at, modified_at, priority, alias)
+                    SELECT notes_id, status_id, due, description, created_at, modified_at, priority,
+                    CASE WHEN alias IN (SELECT alias FROM {0}.Notes) THEN NULL ELSE alias END
+                    FROM Notes WHERE notes_id IN (SELECT value FROM json_each(?)) '''.format(archive)
+                self.cursor.execute(sql_notes, (ids,))
+                sql_nest = ''' INSERT INTO {0}.Nest (parent, child) SELECT parent, child FROM Nest
+                    WHERE child IN (SELECT value FROM json_each(?)) ORDER BY nest_id '''.format(archive)
+                linked = self.cursor.execute(sql_nest, (ids,)).rowcount
+                sql_files = ''' INSERT INTO {0}.Files (file, sha256, part) SELECT file, sha256, part FROM Files
+                    WHERE sha256 IN (SELECT sha256 FROM NoteFiler WHERE notes_id IN (SELECT value FROM json_each(?)))
+                    AND sha256 NOT IN (SELECT sha256 FROM {0}.Files) ORDER BY file_id '''.format(archive)
+                self.cursor.execute(sql_files, (ids,))
+                sql_filer = ''' INSERT INTO {0}.NoteFiler (file_id, notes_id, name, sha256)
+                    SELECT (SELECT file_id FROM {0}.Files AS f WHERE f.sha256 = NoteFiler.sha256 AND f.part = 0), notes_id, name, sha256
+                    FROM NoteFiler WHERE notes_id IN (SELECT value FROM json_each(?)) ORDER BY notefiler_id '''.format(archive)
+                self.cursor.execute(sql_filer, (ids,))
+            with self.transaction():
+                # a note changed by another command since the copy stays here, and its copy is dropped
+                still = set(i[0] for i in self.cursor.execute(sql_closed, (days, days)).fetchall())
+                self.clear_archived(archive, self.id_array(i for i in note_ids if i not in still))
+                note_ids = [i for i in note_ids if i in still]
+                ids = self.id_array(note_ids)
+                self.cursor.execute('DELETE FROM Nest WHERE child IN (SELECT value FROM json_each(?))', (ids,))
+                self.detach_files(note_ids)
+                self.cursor.execute('DELETE FROM Notes WHERE notes_id IN (SELECT value FROM json_each(?))', (ids,))
+                self.tree = None
+        print('Archived ' + str(len(note_ids)) + ' notes and ' + str(linked) + ' parent links to ' + str(path))
+        self.reclaim_space()
+
+    def clear_archived(self, archive, ids):
+        # drop the notes (a JSON id array) from the attached archive, with their links and attachments
+        self.cursor.execute('DELETE FROM {0}.Nest WHERE child IN (SELECT value FROM json_each(?))'.format(archive), (ids,))
+        sql_shas = 'SELECT DISTINCT sha256 FROM {0}.NoteFiler WHERE notes_id IN (SELECT value FROM json_each(?))'.format(archive)
+        shas = [i[0] for i in self.cursor.execute(sql_shas, (ids,)).fetchall()]
+        self.cursor.execute('DELETE FROM {0}.NoteFiler WHERE notes_id IN (SELECT value FROM json_each(?))'.format(archive), (ids,))
+        sql_orphan = ''' DELETE FROM {0}.Files WHERE sha256 = ?
+            AND NOT EXISTS (SELECT 1 FROM {0}.NoteFiler WHERE NoteFiler.sha256 = ?) '''.format(archive)
+        self.cursor.executemany(sql_orphan, [(sha, sha) for sha in shas])
+        self.cursor.execute('DELETE FROM {0}.Notes WHERE notes_id IN (SELECT value FROM json_each(?))'.format(archive), (ids,))
+
+    def reclaim_space(self):
+        # hand the pages --archive freed back to the file system; a database created before
+        # auto_vacuum was set is rebuilt once, so later archives need only incremental_vacuum
+        if self.cursor.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            self.cursor.execute('PRAGMA incremental_vacuum').fetchall()
+        else:
+            print('converting ' + str(self.DB) + ' to incremental vacuum')
+            self.cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self.cursor.execute('VACUUM')
+
+    def valid_across(self, s):
+        names = [i.strip() for i in s.split(',') if i.strip()]
+        if not names:
+            raise argparse.ArgumentTypeError("no database names: {0!r}".format(s))
+        return names
+
+    @contextlib.contextmanager
+    def attached(self, names):
+        # (schema, label) of each named database, attached to this connection for the duration;
+        # a name is a database in db_dir without `.sqlite`, or a path to one. The connected one is read as main
+        dbs = []
+        try:
+            for n, name in enumerate(names):
+                path = Path(name) if name.endswith('.sqlite') or os.sep in name else Path(self.DB_DIR) / (name + '.sqlite')
+                if not path.exists():
+                    sys.exit('database not found: ' + str(path))
+                if path.resolve() == Path(self.DB).resolve():
+                    dbs.append(('main', path.stem))
+                    continue
+                schema = self.ACROSS_SCHEMA.format(n)
+                self.cursor.execute('ATTACH DATABASE ? AS ' + schema, (str(path),))
+                dbs.append((schema, path.stem))
+                if self.cursor.execute('PRAGMA {0}.user_version'.format(schema)).fetchone()[0] < len(self.MIGRATIONS):
+                    with contextlib.closing(sqlite3.connect(path)) as conn:
+                        self.upgrade_db(conn.cursor(), path)
+            yield dbs
+        finally:
+            for schema, label in dbs:
+                if schema != 'main':
+                    self.cursor.execute('DETACH DATABASE ' + schema)
+
+    def print_across(self, names, mode = 'nested', status_show = (1,2,3,4,5), find = None, full = False, limit = None, pager = False, regex = None):
+        with self.attached(names) as dbs:
+            lines = self.across_lines(dbs, mode, status_show, find, full, limit, regex)
+            if pager:
+                self.page_lines(lines)
+            else:
+                for chunk in self.chunked(lines, self.QUERY_CHUNK):
+                    self.write_lines(chunk)
+
+    def across_lines(self, dbs, mode, status_show, find = None, full = False, limit = None, regex = None):
+        # one summary table over several databases, each database's rows under its label
+        yield self.note_line()
+        yield self.renderer.header(','.join(label for schema, label in dbs))
+        yield self.note_line()
+        pattern = self.find_pattern(find, regex)
+        rows = self.across_rows(dbs, mode, status_show, find, regex, full_text = bool(pattern or full))
+        shown = rows if limit is None else itertools.islice(rows, limit)
+        label = None
+        for chunk in self.chunked(shown, self.QUERY_CHUNK):
+            for row, gen in chunk:
+                if row[10] != label:
+                    label = row[10]
+                    yield self.renderer.db_label(label)
+                if not pattern and not full:
+                    yield self.renderer.summary_formatted(row, gen)
+                else:
+                    yield from self.renderer.note_lines(row, gen, pattern, full)
+        yield self.note_line()
+
+    def across_rows(self, dbs, mode, status_show, find = None, regex = None, full_text = True):
+        # (row, gen) from a single UNION ALL over the databases; each row ends with its database's
+        # label, so a note is named by (label, id). Nesting is resolved within each database
+        status_filter = "+Notes.status_id IN ({seq})".format(seq=','.join(['?']*len(status_show)))
+        sql_vars = tuple(status_show)
+        if regex:
+            status_filter += " AND Notes.description REGEXP ?"
+            sql_vars += (regex,)
+        columns = self.row_columns(full_text)
+        parts = []
+        params = []
+        for n, (schema, label) in enumerate(dbs):
+            if find:
+                parts.append("SELECT {2}, ? AS db, ? AS db_order, bm25(NotesFTS) AS rank \
+                FROM {0}.NotesFTS JOIN {0}.Notes AS Notes ON Notes.notes_id = NotesFTS.rowid \
+                LEFT JOIN {0}.Status AS Status ON Notes.status_id = Status.status_id \
+                WHERE NotesFTS MATCH ? AND {1}".format(schema, status_filter, columns))
+                params.extend((label, n, self.match_query(find)) + sql_vars)
+            else:
+                parts.append("SELECT {2}, ? AS db, ? AS db_order, 0 AS rank \
+                FROM {0}.Notes AS Notes LEFT JOIN {0}.Status AS Status ON Notes.status_id = Status.status_id \
+                WHERE {1}".format(schema, status_filter, columns))
+                params.extend((label, n) + sql_vars)
+        # flat --find ranks the matches of every database together, best first
+        order = " ORDER BY rank, db_order, 1" if find and mode == 'flat' else " ORDER BY db_order, 1"
+        rows = self.conn.execute(" UNION ALL ".join(parts) + order, params)
+        if mode != 'nested':
+            yield from ((row, 0) for row in rows)
+            return
+        for n, group in itertools.groupby(rows, key=lambda row: row[11]):
+            group = {row[0]: row for row in group}
+            schema = dbs[n][0]
+            if schema == 'main':
+                walked = self.family_tree()
+            else:
+                with self.phase('tree'):
+                    sql = ' SELECT parent, child FROM {0}.Nest ORDER BY nest_id '.format(schema)
+                    walked = FamilyTree(self.conn.execute(sql)).walk()
+            ids, gens = self.nest_notes(group, walked)
+            yield from ((group[i], g) for i, g in zip(ids, gens))
+
+    def page_lines(self, lines):
+        # feed lines to the pager as they are produced; quitting it stops the work
+        import subprocess
+        with self.phase('pager'):
+            pager = subprocess.Popen(self.view_note_cmd, shell=True, stdin=subprocess.PIPE,
+                    errors='backslashreplace', universal_newlines=True) # text=, from python 3.7
+            try:
+                for chunk in self.chunked(lines, self.QUERY_CHUNK):
+                    pager.stdin.write('\n'.join(chunk) + '\n')
+                    pager.stdin.flush()
+                pager.stdin.close()
+            except BrokenPipeError: # pager closed before the end
+                with contextlib.suppress(BrokenPipeError):
+                    pager.stdin.close()
+            pager.wait()
 
     def display_note(self, note_id):
         print(self.note_line() + '\n' + self.note_header() + '\n' + self.note_line())
         self.print_flat(note_id, find = None, full = True)
-
-    def query_row(self, note_id):
-        sql = ''' SELECT * FROM Notes LEFT JOIN Status ON Notes.status_id = Status.status_id WHERE notes_id = ? '''
-        self.cursor.execute(sql, (note_id,))
-        row = self.cursor.fetchone()
-        return(row)
+        self.write_lines(self.attachment_lines(note_id))
+
+    def attachment_lines(self, note_ids):
+        # length() is answered from the record header, so no blob pages are read
+        sql = ''' SELECT NoteFiler.notes_id, NoteFiler.name,
+            (SELECT sum(length(file)) FROM Files WHERE Files.sha256 = NoteFiler.sha256)
+            FROM NoteFiler WHERE notes_id = ? ORDER BY notefiler_id '''
+        lines = []
+        for note_id in note_ids:
+            lines.extend(str(i).rjust(5) + ' attached ' + name + ' (' + str(size or 0) + ' bytes)'
+                    for i, name, size in self.cursor.execute(sql, (note_id,)).fetchall())
+        return lines
+
+    def print_relatives(self, note_ids, ancestors = False, status_show = (1,2,5), full = False):
+        # each note under its ancestors, or above its whole subtree, from one NestClosure lookup;
+        # notes that are also on the other side of a circular link are marked like nest_notes does
+        near, far = ('descendant', 'ancestor') if ancestors else ('ancestor', 'descendant')
+        status_filter = ','.join(':s' + str(i) for i in range(len(status_show)))
+        sql = ''' SELECT {columns}, rel.depth,
+            EXISTS (SELECT 1 FROM NestClosure WHERE {near} = rel.note AND {far} = :note AND rel.depth > 0)
+            FROM (SELECT :note AS note, 0 AS depth
+                UNION ALL SELECT {far}, depth FROM NestClosure WHERE {near} = :note AND {far} != :note) AS rel
+            JOIN Notes ON Notes.notes_id = rel.note
+            LEFT JOIN Status ON Notes.status_id = Status.status_id
+            WHERE rel.depth = 0 OR Notes.status_id IN ({status})
+            ORDER BY rel.depth {order}, Notes.notes_id '''.format(near=near, far=far, status=status_filter, columns=self.row_columns(full),
+                    order='DESC' if ancestors else 'ASC')
+        params = {'s' + str(i): status for i, status in enumerate(status_show)}
+        lines = [self.note_line(), self.note_header(), self.note_line()]
+        for note_id in note_ids:
+            params['note'] = note_id
+            found = self.cursor.execute(sql, params).fetchall()
+            top = max((row[-2] for row in found), default=0)
+            rows = [row[:-2] for row in found]
+            # ancestors count down to the note, farthest first; the subtree counts down from it
+            gens = [-1 if circular else (top - depth if ancestors else depth) for *row, depth, circular in found]
+            if full:
+                lines.extend(line for row, gen in zip(rows, gens) for line in self.renderer.note_lines(row, gen, None, True))
+            else:
+                lines.extend(self.renderer.summary_rows(rows, gens))
+                lines.append(self.note_line())
+        self.write_lines(lines)
 
     def print_note(self, note_id, gen = 0):
         row = self.query_row(note_id)
         if not row:
             print('Note does not exist: ' + str(note_id))
         else:
-            pydoc.pipepager(
-                self.note_line() + '\n' + self.note_header() + '\n' + self.note_line() + \
-                '\n' + self.summary_formatted(row, gen) + \
-                '\n' + self.note_line() + \
-                '\n' + row[3] + \
-                '\n\n' + ('created ' + row[4] + ' & modified ' + row[5]).ljust(self.snippet_width + 17, ">").rjust(self.snippet_width + 24, "<") \
-                , cmd=self.view_note_cmd)
+            import pydoc
+            with self.phase('pager'):
+                pydoc.pipepager(
+                    self.note_line() + '\n' + self.note_header() + '\n' + self.note_line() + \
+                    '\n' + self.summary_formatted(row, gen) + \
+                    '\n' + self.note_line() + \
+                    '\n' + row[3] + \
+                    '\n\n' + ('created ' + row[4] + ' & modified ' + row[5]).ljust(self.snippet_width + 17, ">").rjust(self.snippet_width + 24, "<") \
+                    , cmd=self.view_note_cmd)
 
     # def print_markdown(self, note_id, gen = 0):
     #     row = self.query_row(note_id)
@@ -405,79 +1755,334 @@ class Jot:
     #     note_str = note_summary
     #     plain_summary = '| ' + due_str + ' ' + sts_str + '' + id_str + ' ' + note_str + ' '
 
-    def identifier_to_id(self, note_id):
-        id_list = [int(x) for x in note_id if str(x).isdigit()]
-        alias_list = [x for x in note_id if not str(x).isdigit()]
-        if id_list:
-            sql_id_check = "SELECT notes_id FROM Notes WHERE notes_id IN ({id})".format(id=','.join(['?']*len(id_list)))
-            self.cursor.execute(sql_id_check, id_list)
-            self.conn.commit()
-            id_list = list(sum(self.cursor.fetchall(), ()))
-        if alias_list:
-            sql_alias_check = "SELECT notes_id FROM Notes WHERE alias IN ({alias})".format(alias=','.join(['?']*len(alias_list)))
-            self.cursor.execute(sql_alias_check, alias_list)
-            self.conn.commit()
-            a_ids = list(sum(self.cursor.fetchall(), ()))
-            id_list = id_list + a_ids
-        id_list.sort()
-        return(id_list)
-
-    def remove_note(self, note_id):
-        # may need to be expanded to check other tables?
-        print('Deleting note_id = ' + str(note_id))
-        sql_delete_query = "DELETE FROM Notes where notes_id = ?"
-        self.cursor.execute(sql_delete_query, (str(note_id),))
-        self.conn.commit()
-
-        sql_parents = "Select parent FROM Nest where child = ?"
-        self.cursor.execute(sql_parents, (note_id,))
-        self.conn.commit()
-        parents = self.cursor.fetchall()
-        parents = set(sum(parents, ()))
-
-        sql_orphans = "Select child FROM Nest where parent = ?"
-        self.cursor.execute(sql_orphans, (note_id,))
-        self.conn.commit()
-        orphans = self.cursor.fetchall()
-        orphans = set(sum(orphans, ()))
-
-        sql_delete_nest = "DELETE FROM Nest WHERE parent = ? OR child = ?"
-        self.cursor.execute(sql_delete_nest, (note_id, note_id))
-        self.conn.commit()
-
-        if orphans is not None and parents is not None:
-            sql_adopt = 'INSERT INTO Nest (parent, child) VALUES (?, ?)'
-            for parent in parents:
-                for orphan in orphans:
-                    self.cursor.execute(sql_adopt, (parent, orphan))
-                    self.conn.commit()
-                    print(str(parent) + ' adopted ' + str(orphan))
-
-    def input_note(self, description, status_id, due, priority, alias, note_id, parent_id):
+    def remove_notes(self, note_ids):
+        for note_id, adopted in self.remove_many(note_ids):
+            print('Deleting note_id = ' + str(note_id))
+            [print(str(parent) + ' adopted ' + str(orphan)) for parent, orphan in adopted]
+
+    def attach_files(self, note_ids, paths):
+        if not note_ids:
+            print('Note does not exist')
+            return
+        sql = ''' INSERT INTO NoteFiler (file_id, notes_id, name, sha256) SELECT ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM NoteFiler WHERE notes_id = ? AND name = ? AND sha256 = ?) '''
+        for path in paths:
+            path = Path(path)
+            file_id, sha, stored = self.store_file(path)
+            self.cursor.executemany(sql, [(file_id, i, path.name, sha, i, path.name, sha) for i in note_ids])
+            print(('Stored ' if stored else 'Already stored ') + path.name + ' (sha256 ' + sha[:12] + ')')
+            [print('Attached ' + path.name + ' to note number: ' + str(i)) for i in note_ids]
+
+    def extract_files(self, note_ids, directory):
+        # write each attachment of the notes into directory under its name, streamed part by part
+        sql = 'SELECT name, sha256 FROM NoteFiler WHERE notes_id = ? ORDER BY notefiler_id'
+        sql_parts = 'SELECT file_id FROM Files WHERE sha256 = ? ORDER BY part'
+        found = False
+        for note_id in note_ids:
+            for name, sha in self.cursor.execute(sql, (note_id,)).fetchall():
+                found = True
+                target = Path(directory) / Path(name).name
+                if target.exists():
+                    print('Not overwriting ' + str(target))
+                    continue
+                with open(target, 'wb') as out:
+                    for (file_id,) in self.cursor.execute(sql_parts, (sha,)).fetchall():
+                        for chunk in self.file_chunks(file_id):
+                            out.write(chunk)
+                print('Extracted ' + str(target))
+        if not found:
+            print('No attachments on note(s): ' + ' '.join(str(i) for i in note_ids))
+
+    def input_note(self, description, status_id, due, priority, alias, note_id, parent_id, edited = None):
+        # edited: the editor's text for each note, when main opened it before the command's transaction
         if len(note_id) > 1 or str(alias).isdigit():
             print("You cannot assign an alias to multiple ids as once; alias cannot be a number")
             alias = None
-        sql_alias_check = 'SELECT EXISTS(SELECT 1 FROM Notes WHERE alias = ?);'
-        self.cursor.execute(sql_alias_check, (alias,))
-        self.conn.commit()
-        if str(sum(self.cursor.fetchall(), ())[0]) == "1":
-            print("Alias NOT ACCEPTED: '" + alias + "' is already in use")
-            alias = None
-        elif alias is None:
+        if alias is None:
             print("No Alias Provided")
-        else:
-            print("Alias '" + alias + "' is accepted")
 
-        longEntryFormat = description == "<long-entry-note>"
+        longEntryFormat = description == "<long-entry-note>" and edited is None
+        if edited is not None:
+            description = edited
         if due == "0001-01-01":
             due = None
         if not note_id:
-            self.add_note(description, status_id, due, priority, alias, parent_id, longEntryFormat)
+            self.add_note(description[0] if edited is not None else description, status_id, due, priority, alias, parent_id, longEntryFormat)
         else:
-            for i in note_id:
-                self.edit_note(description, status_id, due, priority, alias, int(i), parent_id, longEntryFormat)
+            self.edit_notes(description, status_id, due, priority, alias, [int(i) for i in note_id], parent_id, longEntryFormat)
+
+    def export_notes(self, path):
+        # .csv or JSON lines, '-' for stdout; rows stream from the cursor so memory stays flat
+        sql = ''' SELECT Notes.notes_id, (SELECT group_concat(parent, ' ') FROM Nest WHERE child = Notes.notes_id),
+            Status.status, due, priority, alias, created_at, modified_at, description
+            FROM Notes LEFT JOIN Status ON Notes.status_id = Status.status_id ORDER BY Notes.notes_id '''
+        import csv
+        import json
+        out = sys.stdout if path == '-' else open(path, 'w', newline='')
+        count = 0
+        try:
+            if path.endswith('.csv'):
+                writer = csv.writer(out)
+                writer.writerow(self.EXPORT_FIELDS)
+                for row in self.conn.execute(sql):
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in self.conn.execute(sql):
+                    record = dict(zip(self.EXPORT_FIELDS, row))
+                    record['parents'] = [int(i) for i in record['parents'].split()] if record['parents'] else []
+                    out.write(json.dumps(record) + '\n')
+                    count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        if out is not sys.stdout:
+            print('Exported ' + str(count) + ' notes to ' + path)
+
+    def spool_path(self):
+        # notes captured by --spool wait in ~/.jot/<name>.spool.jsonl until the next command adds them
+        return self.JOT_DIR / (Path(self.DB).stem + '.spool.jsonl')
+
+    def spool_pending(self):
+        # the spool, or a swapped out part a drain did not finish; one directory scan
+        return any(self.JOT_DIR.glob(self.spool_path().name + '*'))
+
+    @contextlib.contextmanager
+    def open_spool(self, path, exclusive = False):
+        # the spool's descriptor for appending. Where flock exists, appenders share a lock and
+        # drain_spool takes it alone, so the file is swapped out between appends, never during
+        # one; an appender that waited on a file already swapped out opens the new one
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        while True:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                if fcntl is None:
+                    break
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+        try:
+            yield fd
+        finally:
+            os.close(fd)
+
+    def spool_args(self):
+        args = self.args
+        if not args.note or args.identifier or (args.parent is not None and args.parent <= 0):
+            self.parser.error('--spool adds a new note: give -n TEXT, and -p only as a parent id')
+        if args.alias is not None and args.alias.isdigit():
+            self.parser.error('alias cannot be a number')
+        self.spool_note(args.note, args.status, args.date, args.priority, args.alias[:5] if args.alias else None, args.parent)
+
+    def spool_note(self, description, status_id, due, priority, alias, parent_id):
+        # --spool: append the note as one JSON line with a single unsynced write; the database is
+        # not opened, so bursts of captures never wait on its write lock
+        import json
+        if description == "<long-entry-note>":
+            description = self.long_entry_note('')
+        note = {'description': description, 'status': status_id, 'due': None if due == "0001-01-01" else due,
+                'priority': priority, 'alias': alias, 'parents': [parent_id] if parent_id else [],
+                'created_at': datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")}
+        with self.open_spool(self.spool_path()) as fd:
+            os.write(fd, (json.dumps(note) + '\n').encode())
+
+    def drain_spool(self):
+        # add the spooled notes in the order they were captured, in one transaction. The spool is
+        # first swapped out under a name that sorts after every part still waiting, and the names
+        # of the parts read are committed with the notes. A part is only skipped, or removed, once
+        # a committed drain has read it, so a drain cut short is finished by the next and never repeated
+        import json
+        path = self.spool_path()
+        if path.exists():
+            with self.open_spool(path, exclusive=True):
+                # named under the lock, so after every part before it whatever the clock does;
+                # the pid keeps apart two drains that find no parts in one clock tick
+                waiting = [int(p.name[len(path.name) + 1:].split('.')[0]) for p in self.JOT_DIR.glob(path.name + '.*')]
+                stamp = max([int(time.time() * 1e9)] + [i + 1 for i in waiting])
+                os.replace(path, path.with_name(path.name + '.{0:020d}.{1:d}'.format(stamp, os.getpid())))
+        parts = sorted(self.JOT_DIR.glob(path.name + '.*'))
+        if not parts:
+            return []
+        notes, broken = [], 0
+        with self.transaction():
+            # written first so this takes the write lock, and what is read next is current
+            self.cursor.execute("INSERT OR IGNORE INTO DbInfo (name, value) VALUES ('spool_drained', '[]')")
+            value = self.cursor.execute("SELECT value FROM DbInfo WHERE name = 'spool_drained'").fetchone()[0]
+            drained = set(json.loads(value)) if value.startswith('[') else {value} # one name, before the list
+            for part in parts:
+                if part.name in drained: # read by a drain that committed; its removal was cut short or is to come
+                    continue
+                with open(part) as f:
+                    for line in f:
+                        try:
+                            notes.append(json.loads(line))
+                        except ValueError: # cut off by a crash; spooled writes are not synced
+                            broken += 1
+            # an alias taken, a number or given twice is dropped, as add_note drops a taken one
+            sql_taken = 'SELECT alias FROM Notes WHERE alias IN (SELECT value FROM json_each(?))'
+            taken = set(i[0] for i in self.cursor.execute(sql_taken, (json.dumps([n.get('alias') for n in notes]),)))
+            for note in notes:
+                alias = note.get('alias')
+                if alias is not None and (alias in taken or alias.isdigit()):
+                    print("Alias NOT ACCEPTED: '" + alias + "' is already in use")
+                    note['alias'] = None
+                taken.add(alias)
+            ids = self.add_many(notes)
+            # a part's name is kept until its file is gone, and no longer
+            drained = set(i for i in drained if i and (self.JOT_DIR / i).exists()) | set(part.name for part in parts)
+            self.cursor.execute("UPDATE DbInfo SET value = ? WHERE name = 'spool_drained'", (json.dumps(sorted(drained)),))
+        for part in parts:
+            try:
+                part.unlink()
+            except FileNotFoundError: # a concurrent drain got to it first
+                pass
+        if ids:
+            print('Added ' + str(len(ids)) + ' spooled notes: ' + str(ids[0]) + ('-' + str(ids[-1]) if len(ids) > 1 else ''))
+        if broken:
+            print(str(broken) + ' spooled lines were incomplete and skipped')
+        return ids
+
+    def export_changes(self, since):
+        # JSON lines on stdout: the header, then each row written after seq `since`
+        import json
+        for record in self.changes_since(since):
+            sys.stdout.write(json.dumps(record) + '\n')
+
+    def import_changes(self, path):
+        # JSON lines from --sync-export, '-' for stdin; all applied in the command's transaction
+        import json
+        infile = sys.stdin if path == '-' else open(path)
+        try:
+            records = (json.loads(line) for line in infile if line.strip())
+            header = next(records, None)
+            try:
+                applied, skipped = self.apply_changes(itertools.chain([header], records))
+            except ValueError as e:
+                sys.exit(str(e) + ': ' + path)
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+        print('Applied ' + str(applied) + ' changes (' + str(skipped) + ' already applied) from ' + path)
+        print('next export for this copy: --sync-export ' + str(header['through']))
+
+    def import_notes(self, path):
+        # .csv or JSON lines, '-' for stdin; committed every IMPORT_CHUNK notes
+        import csv
+        import json
+        statuses = dict(self.cursor.execute('SELECT status, status_id FROM Status').fetchall())
+        self.cursor.execute('CREATE TEMP TABLE ImportIds (ext_id text PRIMARY KEY, notes_id integer)')
+        self.cursor.execute('CREATE TEMP TABLE ImportNest (child integer, parent text)')
+        infile = sys.stdin if path == '-' else open(path, newline='')
+        count = 0
+        error = None
+        try:
+            if path.endswith('.csv'):
+                records = csv.DictReader(infile)
+            else:
+                records = (json.loads(line) for line in infile if line.strip())
+            try:
+                for chunk in self.chunked(records, self.IMPORT_CHUNK):
+                    # a savepoint, not a rollback, drops a bad chunk: the temp tables above outlive it
+                    self.cursor.execute('SAVEPOINT import_chunk')
+                    try:
+                        self.import_chunk(chunk, statuses, count + 1)
+                    except ValueError:
+                        self.cursor.execute('ROLLBACK TO import_chunk')
+                        raise
+                    finally:
+                        self.cursor.execute('RELEASE import_chunk')
+                    count += len(chunk)
+                    self.conn.commit()
+                    self.cursor.execute('BEGIN IMMEDIATE')
+            except ValueError as e: # the bad row's chunk is dropped; the chunks before it stay, linked below
+                error = str(e)
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+
+        # parents are resolved once every note is in: by id within the file, else by alias
+        sql_links = ''' INSERT INTO Nest (parent, child)
+            SELECT coalesce(ImportIds.notes_id, Notes.notes_id), ImportNest.child FROM ImportNest
+            LEFT JOIN ImportIds ON ImportIds.ext_id = ImportNest.parent
+            LEFT JOIN Notes ON Notes.alias = ImportNest.parent
+            WHERE coalesce(ImportIds.notes_id, Notes.notes_id) IS NOT NULL '''
+        linked = self.cursor.execute(sql_links).rowcount
+        unresolved = self.cursor.execute('SELECT count(*) FROM ImportNest').fetchone()[0] - linked
+        self.cursor.execute('DROP TABLE temp.ImportIds')
+        self.cursor.execute('DROP TABLE temp.ImportNest')
+        self.tree = None
+        print('Imported ' + str(count) + ' notes and ' + str(linked) + ' parent links from ' + path)
+        if unresolved:
+            print(str(unresolved) + ' parent references did not match an id or alias')
+        if error:
+            self.conn.commit()
+            kept = 'rows 1-' + str(count) + ' were imported' if count else 'no rows were imported'
+            sys.exit('Import stopped: ' + error + '. Committed every ' + str(self.IMPORT_CHUNK) + ' rows, '
+                    + kept + '; nothing from the failing batch on was')
+
+    def import_chunk(self, records, statuses, first_row = 1):
+        # rows are numbered from first_row in error messages; a ValueError leaves the chunk to be rolled back
+        import json
+        aliases = [r['alias'] for r in records if r.get('alias')]
+        sql_alias_check = "SELECT alias FROM Notes WHERE alias IN (SELECT value FROM json_each(?))"
+        taken = set(i[0] for i in self.cursor.execute(sql_alias_check, (json.dumps(aliases),)))
+        rows = []
+        for n, r in enumerate(records, start=first_row):
+            alias = r.get('alias') or None
+            if alias in taken:
+                print("Alias NOT ACCEPTED: '" + alias + "' is already in use")
+                alias = None
+            elif alias is not None:
+                taken.add(alias)
+            status = r.get('status') or 1
+            status_id = statuses.get(status)
+            if status_id is None and re.fullmatch(r'[0-9]+', str(status)) and int(status) in statuses.values():
+                status_id = int(status)
+            if status_id is None:
+                raise ValueError('row {0:d}: unknown status {1!r}'.format(n, status))
+            priority = r.get('priority')
+            if priority not in (None, '') and not re.fullmatch(r'-?[0-9]+', str(priority)):
+                raise ValueError('row {0:d}: priority is not a number: {1!r}'.format(n, priority))
+            priority = int(priority) if priority not in (None, '') else None
+            rows.append((status_id, r.get('due') or None, priority, alias, r.get('description'),
+                    r.get('created_at') or None, r.get('modified_at') or None))
+
+        # AUTOINCREMENT hands out consecutive ids after sqlite_sequence within this write transaction
+        sql_seq = "SELECT coalesce(max(seq), 0) FROM sqlite_sequence WHERE name = 'Notes'"
+        first_id = self.cursor.execute(sql_seq).fetchone()[0] + 1
+        sql_note = ''' INSERT INTO Notes (status_id, due, priority, alias, description, created_at, modified_at)
+            VALUES (?, ?, ?, ?, ?, coalesce(?, datetime(CURRENT_TIMESTAMP, 'localtime')),
+            coalesce(?, datetime(CURRENT_TIMESTAMP, 'localtime'))) '''
+        self.cursor.executemany(sql_note, rows)
+
+        ext_ids = [(str(r['id']), i) for r, i in zip(records, itertools.count(first_id)) if r.get('id') not in (None, '')]
+        self.cursor.executemany('INSERT OR REPLACE INTO ImportIds (ext_id, notes_id) VALUES (?, ?)', ext_ids)
+        links = []
+        for r, i in zip(records, itertools.count(first_id)):
+            parents = r.get('parents') or []
+            parents = parents.split() if isinstance(parents, str) else parents if isinstance(parents, list) else [parents]
+            links.extend((i, str(parent)) for parent in parents)
+        self.cursor.executemany('INSERT INTO ImportNest (child, parent) VALUES (?, ?)', links)
+
+    def long_entry_notes(self, note_ids):
+        # open the editor on each note in turn, or once for a new note when there are none
+        if not note_ids:
+            return [self.long_entry_note('')]
+        sql_old = 'SELECT description FROM Notes WHERE notes_id = ?'
+        return [self.long_entry_note(str(self.cursor.execute(sql_old, (int(i),)).fetchone()[0])) for i in note_ids]
 
     def long_entry_note(self, existingNote):
+        import tempfile
+        import subprocess
         f = tempfile.NamedTemporaryFile(mode='w+t', delete=False)
         n = f.name
         f.write(existingNote)
@@ -487,58 +2092,55 @@ class Jot:
             note = f.read()
         return(note.rstrip())
 
-    def nest_parent_child(self, parent, child):
-        if parent is not None and child is not None:
+    def nest_parent_child(self, parent, children):
+        children = [child for child in children if child > 0] if parent is not None else []
+        if children:
             print('parent: ' + str(parent))
-            if parent > 0 and child > 0:
-                sql_nest = 'INSERT INTO Nest (parent, child) VALUES (?, ?)'
-                self.cursor.execute(sql_nest, (parent, child))
-                self.conn.commit()
+            if parent > 0:
+                self.set_parents(children, [parent])
                 print('Parent defined as: ' + str(parent))
-            elif parent < 0 and child > 0: # remove parent link
-                sql_unnest = 'DELETE FROM Nest WHERE parent = ? and child = ?'
-                self.cursor.execute(sql_unnest, (abs(parent), child))
-                self.conn.commit()
+            elif parent < 0: # remove parent link
+                self.remove_parents(children, [abs(parent)])
                 print('Parent removed ' + str(abs(parent)))
-            elif parent == 0 and child > 0: # remove all parents
-                sql_unnest = 'DELETE FROM Nest WHERE child = ?'
-                self.cursor.execute(sql_unnest, (child,))
-                self.conn.commit()
+            elif parent == 0: # remove all parents
+                self.remove_parents(children)
                 print('All parents removed from note')
 
-
     def add_note(self, description, status_id, due, priority, alias, parent_id, longEntryFormat):
-        if not status_id:
-            status_id = 1
         if longEntryFormat:
             description = self.long_entry_note('')
-        sql = 'INSERT INTO Notes (description, status_id, due, priority, alias) VALUES (?, ?, ?, ?, ?)'
-        self.cursor.execute(sql, (description, status_id, due, priority, alias))
-        self.conn.commit()
-        print('Added note number: ' + str(self.cursor.lastrowid))
-        self.nest_parent_child(parent_id, self.cursor.lastrowid)
-
-    def edit_note(self, description, status_id, due, priority, alias, note_id, parent_id, longEntryFormat):
-        sql_old = 'SELECT * FROM Notes where notes_id = ?'
-        self.cursor.execute(sql_old, (str(note_id),))
-        row = self.cursor.fetchone()
-        if longEntryFormat:
-            description = self.long_entry_note(str(row[3]))
-        new_row = (
-                row[0],
-                status_id if status_id is not None else row[1],
-                due if due is not None else row[2],
-                description if description is not None else row[3],
-                row[4],
-                datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S"),
-                priority if priority is not None else row[6],
-                alias if alias is not None else row[7]
-                )
-        sql = 'INSERT or REPLACE into Notes VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
-        self.cursor.execute(sql, new_row)
-        self.conn.commit()
-        print('Edited note number: ' + str(self.cursor.lastrowid))
-        self.nest_parent_child(parent_id, note_id)
+        note = {'description': description, 'status': status_id, 'due': due, 'priority': priority, 'alias': alias}
+        try:
+            note_id, = self.add_many([note])
+        except sqlite3.IntegrityError: # alias is a unique index
+            print("Alias NOT ACCEPTED: '" + alias + "' is already in use")
+            note_id, = self.add_many([dict(note, alias=None)])
+        else:
+            if alias is not None:
+                print("Alias '" + alias + "' is accepted")
+        print('Added note number: ' + str(note_id))
+        self.nest_parent_child(parent_id, [note_id])
+
+    def edit_notes(self, description, status_id, due, priority, alias, note_ids, parent_id, longEntryFormat):
+        if longEntryFormat: # open each note in the editor in turn
+            descriptions = self.long_entry_notes(note_ids)
+        elif isinstance(description, list): # one per note, already written in the editor
+            descriptions = description
+        else:
+            descriptions = [description] * len(note_ids)
+        # attributes not supplied (None) keep their current value
+        changes = [{'id': i, 'description': d, 'status': status_id, 'due': due, 'priority': priority, 'alias': alias}
+                for d, i in zip(descriptions, note_ids)]
+        try:
+            self.update_many(changes)
+        except sqlite3.IntegrityError: # alias is a unique index
+            print("Alias NOT ACCEPTED: '" + alias + "' is already in use")
+            self.update_many([dict(c, alias=None) for c in changes])
+        else:
+            if alias is not None:
+                print("Alias '" + alias + "' is accepted")
+        [print('Edited note number: ' + str(i)) for i in note_ids]
+        self.nest_parent_child(parent_id, note_ids)
 
     def valid_date(self, s):
         try:
@@ -547,7 +2149,13 @@ class Jot:
             msg = "not a valid date: {0!r}".format(s)
             raise argparse.ArgumentTypeError(msg)
 
-    def parse_inputs(self):
+    def parse_inputs(self, argv = None):
+        if self.parser is None: # built once; a resident server parses many commands
+            self.parser = self.argument_parser()
+        args = self.parser.parse_args(argv)
+        self.args = args if args else ''
+
+    def argument_parser(self):
         parser = argparse.ArgumentParser()
         group1 = parser.add_argument_group(title="positional arguments")
         group = parser.add_argument_group(title="item inputs", description="set attributes")
@@ -555,26 +2163,50 @@ class Jot:
         group25 = parser.add_argument_group(title="display options")
         group2 = parser.add_argument_group(title="configure JOT")
         group3 = parser.add_argument_group(title="developer tools")
-        group1.add_argument("identifier", help="Specify note identifier(s) by index or alias (optional)", nargs='*')
+        group1.add_argument("identifier", help="Specify note identifier(s) by index, index range (100-250), alias or alias pattern ('proj*') (optional)", nargs='*')
         group.add_argument("-n", "--note", help="Contents of note or blank to initiate editor", nargs='?', const='<long-entry-note>', default=None)
         group.add_argument("-s", "--status", type=int, choices=[1, 2, 3, 4, 5], help="Status: 1 (notes), 2 (to-do), 3 (complete), 4 (cancelled), 5 (partial)", default=None)
-        group25.add_argument("-f", "--find", help="Find string within notes")
+        group25.add_argument("-f", "--find", type=self.valid_find, help="Find notes containing all words (matched as prefixes) or \"quoted phrases\", best match first; join terms with OR, exclude with NOT, group with ( )")
+        group25.add_argument("--regex", type=self.valid_regex, metavar="PATTERN", help="Show only notes matching this Python regular expression (case-sensitive unless it starts with (?i)); combines with --find")
         group.add_argument("-d", "--date", help="Key Date - format YYYY-MM-DD", type=self.valid_date, nargs='?', const='0001-01-01', default=None)
         group.add_argument("-i", "--priority", nargs='?', const=1, default=None, type=int, help="Prioritize item (priority = 1), or 0 to unprioritize")
         group.add_argument("-a", "--alias", help="Up to 5 character unique alias to replace index", default=None)
         group23.add_argument("-rm", action = "store_true", help="remove item(s)")
+        group23.add_argument("--spool", action = "store_true", help="With -n, only append the note to ~/.jot/<db>.spool.jsonl, without opening the database; the next jot command adds it")
+        group23.add_argument("--flush", action = "store_true", help="Add the notes waiting in the spool now")
+        group23.add_argument("--import", dest="import_file", metavar="FILE", help="Import notes from a .csv or JSON lines file (- for stdin), committed every %d rows; a bad row stops the import, keeping the rows committed before it" % self.IMPORT_CHUNK)
+        group23.add_argument("--export", dest="export_file", metavar="FILE", help="Export all notes to a .csv or JSON lines file (- for stdout)")
+        group23.add_argument("--sync-export", type=int, metavar="SEQ", help="Write every note, link and alias changed after journal position SEQ (0 for all) as JSON lines to stdout")
+        group23.add_argument("--sync-import", metavar="FILE", help="Apply a --sync-export file (- for stdin) to this database; changes already applied are skipped")
+        group23.add_argument("--sync-reid", action = "store_true", help="Give a copy of another database's file its own sync identity, so changes can flow between them")
+        group23.add_argument("--sync-compact", action = "store_true", help="Drop the change journal's superseded entries now (done every %d writes anyway)" % self.COMPACT_EVERY)
+        group23.add_argument("--archive", action = "store_true", help="Move complete and cancelled notes, when everything nested under them is closed too, into <db>.archive.sqlite")
+        group23.add_argument("--older-than", type=int, metavar="DAYS", default=None, help="With --archive, only notes not modified in DAYS days")
+        group23.add_argument("--attach", metavar="PATH", nargs='+', help="Attach file(s) to the identified note(s); identical content is stored once")
+        group23.add_argument("--extract", metavar="DIR", nargs='?', const='.', default=None, help="Write the identified notes' attachments into DIR (current directory if blank)")
         group.add_argument("-p", "--parent", nargs='?', const=0, default=None, type=int, help="Assign parent, 0 or blank to remove all, -id to remove specific id")
-        group25.add_argument("-l", "--less", action = 'store_true', help="Display using `less`")
+        group25.add_argument("-l", "--less", action = 'store_true', help="Display using `less`; without identifiers the summary streams into it")
+        group25.add_argument("--limit", type=int, metavar="N", help="Show at most N notes of the summary")
+        group25.add_argument("--after", type=self.valid_after, metavar="ID", help="Start the summary after this note, as given at the end of the previous --limit page")
+        group25.add_argument("--subtree", action = "store_true", help="Show the identified note(s) with everything nested under them")
+        group25.add_argument("--ancestors", action = "store_true", help="Show the identified note(s) below every note they are nested under")
+        group25.add_argument("--archived", action = "store_true", help="Include the notes moved out by --archive in the summary, -v and --find")
+        group25.add_argument("--across", type=self.valid_across, metavar="DBS", help="Show the summary of several databases (comma separated names as for -dbname, or paths) as one table")
+        group25.add_argument("--sort", choices=sorted(self.SORTS), help="List the notes with a due date (earliest first), a priority (1 first) or all by last modified (newest first)")
+        group25.add_argument("--agenda", type=int, nargs='?', const=7, default=None, metavar="DAYS", help="List the notes due from today through DAYS days from now (7 if blank), earliest first")
+        group25.add_argument("--overdue", action = "store_true", help="List the notes due before today, earliest first (with --agenda, before the end of the agenda)")
+        group25.add_argument("--watch", type=float, nargs='?', const=1.0, default=None, metavar="SECONDS", help="Keep the summary on screen and redraw the lines that change, checking every SECONDS (1 if blank); -o, -v, --sort, --agenda and --overdue apply")
         group25.add_argument("-o", "--order", type=str, choices=['nested', 'flat'], help="Note summary table style", default = 'nested')
         group25.add_argument("-v", "--verbose", action = "store_true", help="Increase output verbosity")
         group2.add_argument("-config", help="Configure JOT preferences", action = "store_true")
         group2.add_argument("-dir", help="set db directory, current working directory if no argument", nargs='?', default=None, const='pwd')
         group2.add_argument("-dbname", help="set db name to supplied argument (filename excluding `.sqlite` extension) or jot (default) if none", nargs='?', const='jot', default=None)
+        group2.add_argument("--serve", action = "store_true", help="Stay resident and answer jot commands over a socket in ~/.jot until interrupted")
         group3.add_argument("-code", action = "store_true", help="Open python code for development")
+        group3.add_argument("--profile", action = "store_true", help="Print time spent per phase and per SQL statement to stderr (or set JOT_TRACE=1)")
         group3.add_argument("-readme", action = "store_true", help="Open README.md for editing")
         group3.add_argument("-sqlite", action = "store_true", help="Open create.sqlite for editing")
-        args = parser.parse_args()
-        self.args = args if args else ''
+        return parser
 
 #    def input_logic(self):
 #        args = self.args
@@ -588,8 +2220,122 @@ class Jot:
 #                else:
 #                    print("Use -s -d -i or -p but not -a when editing multiple items")
 
+    def serve(self):
+        # one connection, config and tree kept warm; commands run one at a time. Requests and
+        # replies are JSON: whatever reaches the socket is only ever parsed as data
+        import socket
+        import json
+        import signal
+        path = self.JOT_DIR / self.SOCKET_NAME
+        if path.exists():
+            with socket.socket(socket.AF_UNIX) as probe:
+                try:
+                    probe.connect(str(path))
+                except OSError: # left behind by a server that did not shut down
+                    path.unlink()
+                else:
+                    sys.exit('jot is already serving on ' + str(path))
+        server = socket.socket(socket.AF_UNIX)
+        umask = os.umask(0o077) # the socket is created owner-only, not opened up until a chmod
+        try:
+            server.bind(str(path))
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        server.listen()
+        self.data_version = None
+        self.today = None
+        self.replies = {} # argv -> reply of read-only commands since the last write
+        print('serving ' + str(self.DB) + ' on ' + str(path))
+        # `kill` stops the server as Ctrl-C does, through the finally that removes the socket
+        sigterm = signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            while True:
+                client, address = server.accept()
+                with client:
+                    client.settimeout(self.CLIENT_TIMEOUT) # one that stalls is dropped, not waited on
+                    try:
+                        argv = json.loads(b''.join(iter(lambda: client.recv(65536), b'')).decode())
+                        if not isinstance(argv, list) or not all(isinstance(i, str) for i in argv):
+                            raise ValueError('not an argument list')
+                        client.sendall(json.dumps(self.serve_request(argv)).encode())
+                    except (OSError, ValueError): # client went away or stalled, or sent nothing or not a command
+                        pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, sigterm)
+            server.close()
+            path.unlink()
+
+    def serve_request(self, argv):
+        # (exit status, stdout, stderr) of one command; status None sends it back to run directly
+        self.refresh()
+        key = tuple(argv)
+        if key in self.replies:
+            return self.replies[key]
+        changes = self.conn.total_changes
+        out = io.StringIO()
+        err = io.StringIO()
+        status = 0
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                self.parse_inputs(argv)
+                args = self.args
+                # editors, pagers, files and config changes need the caller's terminal or cwd; writes to
+                # other databases --across and --archived read would not be seen by the reply cache
+                if (args.serve or args.note == '<long-entry-note>' or args.less or args.code or args.readme
+                        or args.sqlite or args.config or args.dir or args.dbname or args.import_file or args.export_file
+                        or args.sync_import or args.sync_export is not None or args.attach or args.extract
+                        or args.profile or args.across or args.archive or args.archived or args.spool
+                        or args.watch is not None):
+                    return None, '', ''
+                self.main()
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    print(e.code, file=sys.stderr)
+                status = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                status = 1
+        reply = (status, out.getvalue(), err.getvalue())
+        if self.conn.total_changes != changes:
+            self.replies = {}
+        elif status == 0 and len(self.replies) < 100:
+            self.replies[key] = reply
+        return reply
+
+    def refresh(self):
+        # pick up config.csv edits and writes other jot processes committed since the last command
+        conf = self.JOT_DIR / 'config.csv'
+        stat = conf.stat() if conf.exists() else None
+        if stat is None or (str(conf), stat.st_mtime_ns, stat.st_size) != self.config_key:
+            self.conn.close()
+            self.read_config()
+            self.connect()
+            self.tree = None
+            self.data_version = None
+        version = self.cursor.execute('PRAGMA data_version').fetchone()[0]
+        if version != self.data_version or self.spool_pending(): # the command will drain the spool first
+            self.tree = None
+            self.replies = {}
+            self.data_version = version
+        # --agenda and --overdue count from today, so no reply outlives its day
+        today = datetime.now().date()
+        if today != self.today:
+            self.replies = {}
+            self.today = today
+
     def main(self):
         args = self.args
+        # checked before anything is written: the --across and --archived summary has no place for these
+        if (args.across or args.archived) and (args.identifier or args.sort or args.agenda is not None
+                or args.overdue or args.after is not None):
+            self.parser.error('--across and --archived show the summary of several databases: they cannot be '
+                    'combined with note ids, --sort, --agenda, --overdue or --after')
+        if args.older_than is not None and not args.archive:
+            self.parser.error('--older-than only applies to --archive')
         # Set Preferences
         if args.dir and args.dbname:
             self.set_db_dir(args.dir)
@@ -601,67 +2347,110 @@ class Jot:
         elif args.dbname:
             self.set_db_name(args.dbname)
             self.connect()
-        # Input
-        if args.code or args.readme or args.sqlite or args.config:
-            if args.code:
-                subprocess.call([self.EDITOR, self.SRC_DIR / 'jot.py'])
-            if args.config:
-                subprocess.call([self.EDITOR, self.JOT_DIR / 'config.csv'])
-            if args.readme:
-                subprocess.call([self.EDITOR, self.SRC_DIR.parent / 'README.md'])
-            if args.sqlite:
-                subprocess.call([self.EDITOR, self.SRC_DIR / 'create_db.sql'])
-        elif args.note or (args.identifier and (args.status or args.date or args.priority or args.alias or args.parent)):
-            self.input_note(description=args.note, status_id=args.status, due=args.date, priority=args.priority, alias=args.alias[:5] if args.alias else None, note_id=self.identifier_to_id(args.identifier), parent_id=args.parent)
-        elif args.rm:
-            [self.remove_note(i) for i in self.identifier_to_id(args.identifier)]
+        if self.spool_pending():
+            with self.phase('input'):
+                self.drain_spool()
+        elif args.flush:
+            print('Nothing spooled for ' + str(self.DB))
+        if args.archive: # attaches the archive, which cannot happen inside the command's transaction
+            with self.phase('input'):
+                self.archive_notes(args.older_than or 0)
+        # Input; a command that writes takes the write lock up front, one that only reads never waits on it
+        writes = bool(args.note or args.rm or args.import_file or args.sync_import or args.sync_reid or args.sync_compact or args.attach
+                or (args.identifier and (args.status or args.date or args.priority or args.alias or args.parent)))
+        edited = None
+        if args.note == '<long-entry-note>' and not (args.code or args.readme or args.sqlite or args.config):
+            # the editor is open before the write lock is taken, so it never holds off other writers
+            edited = self.long_entry_notes(self.identifier_to_id(args.identifier))
+        with self.phase('input'), self.transaction(write = writes):
+            if args.code or args.readme or args.sqlite or args.config:
+                import subprocess
+                if args.code:
+                    subprocess.call([self.EDITOR, self.SRC_DIR / 'jot.py'])
+                if args.config:
+                    subprocess.call([self.EDITOR, self.JOT_DIR / 'config.csv'])
+                if args.readme:
+                    subprocess.call([self.EDITOR, self.SRC_DIR.parent / 'README.md'])
+                if args.sqlite:
+                    subprocess.call([self.EDITOR, self.SRC_DIR / 'create_db.sql'])
+            elif args.note or (args.identifier and (args.status or args.date or args.priority or args.alias or args.parent)):
+                self.input_note(description=args.note, status_id=args.status, due=args.date, priority=args.priority, alias=args.alias[:5] if args.alias else None, note_id=self.identifier_to_id(args.identifier), parent_id=args.parent, edited=edited)
+            elif args.rm:
+                self.remove_notes(self.identifier_to_id(args.identifier))
+            elif args.import_file:
+                self.import_notes(args.import_file)
+            elif args.sync_import:
+                self.import_changes(args.sync_import)
+            elif args.sync_reid:
+                print('New db_id: ' + self.new_db_id())
+            elif args.sync_compact:
+                print('Dropped ' + str(self.compact_changes()) + ' superseded journal entries')
+            elif args.attach:
+                self.attach_files(self.identifier_to_id(args.identifier), args.attach)
         # Output
-        if args.less:
-            [self.print_note(i) for i in self.identifier_to_id(args.identifier)]
-        elif args.verbose:
-            self.print_notes(mode = args.order, status_show = (1,2,3,4,5), find = args.find, full = True)
-        elif args.identifier:
-            self.display_note(self.identifier_to_id(args.identifier))
-        else: # if no options, show active notes
-            self.print_notes(mode = args.order, status_show = (1,2,5), find = args.find)
+        due = self.due_range(args.agenda, args.overdue) if args.agenda is not None or args.overdue else None
+        with self.phase('output'):
+            if args.export_file:
+                self.export_notes(args.export_file)
+            elif args.sync_export is not None:
+                self.export_changes(args.sync_export)
+            elif args.extract:
+                self.extract_files(self.identifier_to_id(args.identifier), args.extract)
+            elif args.less and args.identifier:
+                [self.print_note(i) for i in self.identifier_to_id(args.identifier)]
+            elif args.identifier and (args.subtree or args.ancestors):
+                self.print_relatives(self.identifier_to_id(args.identifier), ancestors = args.ancestors,
+                        status_show = (1,2,3,4,5) if args.verbose else (1,2,5), full = args.verbose)
+            elif args.watch is not None:
+                if args.find or args.regex or args.across or args.archived or args.after is not None \
+                        or args.limit is not None or args.less or args.identifier:
+                    self.parser.error('--watch shows the summary: combine it only with -o, -v, --sort, --agenda and --overdue')
+                self.watch(max(args.watch, 0.1), mode = args.order, status_show = (1,2,3,4,5) if args.verbose else (1,2,5),
+                        sort = args.sort, due = due)
+            elif args.across or (args.archived and self.archive_path().exists()):
+                across = args.across or [str(self.DB), str(self.archive_path())]
+                self.print_across(across, mode = args.order, status_show = (1,2,3,4,5) if args.verbose else (1,2,5),
+                        find = args.find, full = args.verbose, limit = args.limit, pager = args.less, regex = args.regex)
+            elif args.verbose:
+                self.print_notes(mode = args.order, status_show = (1,2,3,4,5), find = args.find, full = True,
+                        limit = args.limit, after = args.after, pager = args.less, regex = args.regex,
+                        sort = args.sort, due = due)
+            elif args.identifier:
+                self.display_note(self.identifier_to_id(args.identifier))
+            else: # if no options, show active notes
+                self.print_notes(mode = args.order, status_show = (1,2,5), find = args.find,
+                        limit = args.limit, after = args.after, pager = args.less, regex = args.regex,
+                        sort = args.sort, due = due)
+
+def forward(argv):
+    # hand the command to a running `jot --serve`; False means run it in this process
+    import socket
+    if not hasattr(socket, 'AF_UNIX') or '--serve' in argv or '--profile' in argv or '--spool' in argv \
+            or os.environ.get('JOT_TRACE', '0') not in ('', '0'):
+        return False
+    client = socket.socket(socket.AF_UNIX)
+    try:
+        client.connect(str(Path.home() / '.jot' / Jot.SOCKET_NAME))
+    except OSError: # no server running
+        client.close()
+        return False
+    import json
+    with client:
+        client.sendall(json.dumps(argv).encode())
+        client.shutdown(socket.SHUT_WR)
+        status, out, err = json.loads(b''.join(iter(lambda: client.recv(65536), b'')).decode())
+    if status is None:
+        return False
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    if status:
+        sys.exit(status)
+    return True
 
 
 def main():
-    Jot()
+    if not forward(sys.argv[1:]):
+        Jot()
 
 if __name__ == "__main__":
     main()
-
-# def convertToBinaryData(filename):
-#     # Convert digital data to binary format
-#     with open(filename, 'rb') as file:
-#         blobData = file.read()
-#     return blobData
-#
-
-# def insertBLOB(empId, name, photo, resumeFile):
-#     try:
-#         sqliteConnection = sqlite3.connect(DB)
-#         cursor = sqliteConnection.cursor()
-#         print("Connected to SQLite")
-#         sqlite_insert_blob_query = """ INSERT INTO Files
-#                                   (id, name, photo, resume) VALUES (?, ?, ?, ?)"""
-#
-#         empPhoto = convertToBinaryData(photo)
-#         resume = convertToBinaryData(resumeFile)
-#         # Convert data into tuple format
-#         data_tuple = (empId, name, empPhoto, resume)
-#         cursor.execute(sqlite_insert_blob_query, data_tuple)
-#         sqliteConnection.commit()
-#         print("Image and file inserted successfully as a BLOB into a table")
-#         cursor.close()
-#
-#     except sqlite3.Error as error:
-#         print("Failed to insert blob data into sqlite table", error)
-#     finally:
-#         if sqliteConnection:
-#             sqliteConnection.close()
-#             print("the sqlite connection is closed")
-#
-# insertBLOB(1, "Smith", "E:\pynative\Python\photos\smith.jpg", "E:\pynative\Python\photos\smith_resume.txt")
-# insertBLOB(2, "David", "E:\pynative\Python\photos\david.jpg", "E:\pynative\Python\photos\david_resume.txt")
@@ -0,0 +1,93 @@
+-- schema upgrade 7: a journal of changed rows for --sync-export and --sync-import
+
+-- one entry per write to a Notes, Nest or Alias row. An export sends each row's current
+-- state (or its deletion) once, at its latest seq, so compaction keeps only that entry
+CREATE TABLE IF NOT EXISTS Changes (
+	seq integer PRIMARY KEY AUTOINCREMENT,
+	tbl text NOT NULL,
+	row_id integer NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS changes_row ON Changes (tbl, row_id);
+
+-- db_id names this database to the ones it syncs to; compacted_seq is where compaction last ran
+CREATE TABLE IF NOT EXISTS DbInfo (
+	name text PRIMARY KEY,
+	value text
+);
+
+INSERT OR IGNORE INTO DbInfo (name, value) VALUES ('db_id', lower(hex(randomblob(16))));
+
+-- the last seq of each other database's journal that --sync-import has applied here
+CREATE TABLE IF NOT EXISTS ChangesSeen (
+	db_id text PRIMARY KEY,
+	seq integer NOT NULL
+);
+
+-- rows written before the journal existed, so an export since 0 is a whole copy
+INSERT INTO Changes (tbl, row_id) SELECT 'Notes', notes_id FROM Notes
+    WHERE NOT EXISTS (SELECT 1 FROM Changes WHERE tbl = 'Notes' AND row_id = notes_id) ORDER BY notes_id;
+INSERT INTO Changes (tbl, row_id) SELECT 'Nest', nest_id FROM Nest
+    WHERE NOT EXISTS (SELECT 1 FROM Changes WHERE tbl = 'Nest' AND row_id = nest_id) ORDER BY nest_id;
+INSERT INTO Changes (tbl, row_id) SELECT 'Alias', Alias.rowid FROM Alias
+    WHERE NOT EXISTS (SELECT 1 FROM Changes WHERE tbl = 'Alias' AND row_id = Alias.rowid) ORDER BY Alias.rowid;
+
+CREATE TRIGGER IF NOT EXISTS changes_notes_insert
+AFTER INSERT ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Notes', NEW.notes_id);
+END;
+
+-- the summary columns follow the description, so they are not changes of their own
+CREATE TRIGGER IF NOT EXISTS changes_notes_update
+AFTER UPDATE OF notes_id, status_id, due, description, created_at, modified_at, priority, alias ON Notes
+FOR EACH ROW
+WHEN OLD.notes_id IS NOT NEW.notes_id OR OLD.status_id IS NOT NEW.status_id OR OLD.due IS NOT NEW.due
+    OR OLD.description IS NOT NEW.description OR OLD.created_at IS NOT NEW.created_at
+    OR OLD.modified_at IS NOT NEW.modified_at OR OLD.priority IS NOT NEW.priority OR OLD.alias IS NOT NEW.alias
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Notes', OLD.notes_id), ('Notes', NEW.notes_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_notes_delete
+AFTER DELETE ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Notes', OLD.notes_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_nest_insert
+AFTER INSERT ON Nest
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Nest', NEW.nest_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_nest_delete
+AFTER DELETE ON Nest
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Nest', OLD.nest_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_alias_insert
+AFTER INSERT ON Alias
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Alias', NEW.rowid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_alias_update
+AFTER UPDATE ON Alias
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Alias', OLD.rowid), ('Alias', NEW.rowid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_alias_delete
+AFTER DELETE ON Alias
+FOR EACH ROW
+BEGIN
+    INSERT INTO Changes (tbl, row_id) VALUES ('Alias', OLD.rowid);
+END;
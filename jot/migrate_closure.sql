@@ -0,0 +1,78 @@
+-- schema upgrade 4: closure table of the Nest hierarchy for subtree and ancestor views
+
+-- every (ancestor, descendant) pair of the Nest links with the length of the shortest path between
+-- them; a note on a circular link is its own ancestor. Kept current by the nest_closure triggers
+CREATE TABLE IF NOT EXISTS NestClosure (
+	ancestor integer NOT NULL,
+	descendant integer NOT NULL,
+	depth integer NOT NULL,
+	PRIMARY KEY (ancestor, descendant)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS nest_closure_descendant ON NestClosure (descendant);
+
+-- a new link joins every ancestor of the parent (and the parent) to every descendant
+-- of the child (and the child); depth keeps the shortest path. Repeated links add nothing.
+-- Pairs already joined are shortened, then new ones added: no UPSERT, which needs sqlite 3.24
+CREATE TRIGGER IF NOT EXISTS nest_closure_insert
+AFTER INSERT ON Nest
+FOR EACH ROW
+WHEN (SELECT count(*) FROM Nest WHERE parent = NEW.parent AND child = NEW.child) = 1
+BEGIN
+    UPDATE NestClosure SET depth = min(depth, 1
+        + (SELECT min(depth) FROM (SELECT NEW.parent AS ancestor, 0 AS depth
+            UNION ALL SELECT ancestor, depth FROM NestClosure WHERE descendant = NEW.parent) AS up
+            WHERE up.ancestor = NestClosure.ancestor)
+        + (SELECT min(depth) FROM (SELECT NEW.child AS descendant, 0 AS depth
+            UNION ALL SELECT descendant, depth FROM NestClosure WHERE ancestor = NEW.child) AS down
+            WHERE down.descendant = NestClosure.descendant))
+    WHERE ancestor IN (SELECT NEW.parent UNION SELECT ancestor FROM NestClosure WHERE descendant = NEW.parent)
+    AND descendant IN (SELECT NEW.child UNION SELECT descendant FROM NestClosure WHERE ancestor = NEW.child);
+
+    INSERT OR IGNORE INTO NestClosure (ancestor, descendant, depth)
+    SELECT up.ancestor, down.descendant, min(up.depth + 1 + down.depth)
+    FROM (SELECT NEW.parent AS ancestor, 0 AS depth
+            UNION ALL SELECT ancestor, depth FROM NestClosure WHERE descendant = NEW.parent) AS up,
+        (SELECT NEW.child AS descendant, 0 AS depth
+            UNION ALL SELECT descendant, depth FROM NestClosure WHERE ancestor = NEW.child) AS down
+    GROUP BY up.ancestor, down.descendant;
+END;
+
+-- backfill: replay the existing links through the insert trigger in their original order
+CREATE TEMP TABLE NestCopy AS SELECT nest_id, parent, child FROM Nest;
+DELETE FROM Nest;
+INSERT INTO Nest (nest_id, parent, child) SELECT nest_id, parent, child FROM NestCopy ORDER BY nest_id;
+DROP TABLE temp.NestCopy;
+
+-- only pairs from an ancestor of the parent to a descendant of the child can have
+-- depended on the link. They are dropped, then found again by walking into the
+-- child's side from the distances that did not depend on it; the walk is bounded,
+-- so circular links end it too. Nothing changes while an identical link remains.
+CREATE TRIGGER IF NOT EXISTS nest_closure_delete
+AFTER DELETE ON Nest
+FOR EACH ROW
+WHEN NOT EXISTS (SELECT 1 FROM Nest WHERE parent = OLD.parent AND child = OLD.child)
+BEGIN
+    DELETE FROM NestClosure
+    WHERE ancestor IN (SELECT OLD.parent UNION SELECT ancestor FROM NestClosure WHERE descendant = OLD.parent)
+    AND descendant IN (SELECT OLD.child UNION SELECT descendant FROM NestClosure WHERE ancestor = OLD.child);
+
+    INSERT INTO NestClosure (ancestor, descendant, depth)
+    SELECT top, id, min(depth) FROM (
+        WITH RECURSIVE
+        up(id) AS (SELECT OLD.parent UNION SELECT Nest.parent FROM Nest JOIN up ON Nest.child = up.id),
+        down(id) AS (SELECT OLD.child UNION SELECT Nest.child FROM Nest JOIN down ON Nest.parent = down.id),
+        seed(top, id, depth) AS (
+            SELECT id, id, 0 FROM up
+            UNION ALL SELECT ancestor, descendant, depth FROM NestClosure
+            WHERE ancestor IN (SELECT id FROM up) AND descendant NOT IN (SELECT id FROM down)),
+        reach(top, id, depth) AS (
+            SELECT seed.top, Nest.child, seed.depth + 1 FROM seed JOIN Nest ON Nest.parent = seed.id
+            WHERE Nest.child IN (SELECT id FROM down)
+            UNION
+            SELECT reach.top, Nest.child, reach.depth + 1 FROM reach JOIN Nest ON Nest.parent = reach.id
+            WHERE Nest.child IN (SELECT id FROM down)
+            AND reach.depth <= (SELECT max(depth) FROM seed) + (SELECT count(*) FROM down))
+        SELECT top, id, depth FROM reach)
+    GROUP BY top, id;
+END;
@@ -0,0 +1,10 @@
+-- schema upgrade 3: content-addressed attachments stored in parts on Files
+
+ALTER TABLE Files ADD COLUMN sha256 text;
+ALTER TABLE Files ADD COLUMN part integer NOT NULL DEFAULT 0;
+ALTER TABLE NoteFiler ADD COLUMN name text;
+ALTER TABLE NoteFiler ADD COLUMN sha256 text;
+
+CREATE UNIQUE INDEX IF NOT EXISTS files_sha256 ON Files (sha256, part);
+CREATE INDEX IF NOT EXISTS notefiler_notes ON NoteFiler (notes_id);
+CREATE INDEX IF NOT EXISTS notefiler_sha256 ON NoteFiler (sha256);
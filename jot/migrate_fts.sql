@@ -0,0 +1,33 @@
+-- schema upgrade 1: full-text index on Notes.description for databases created without it
+
+CREATE VIRTUAL TABLE IF NOT EXISTS NotesFTS USING fts5(
+	description,
+	content = 'Notes',
+	content_rowid = 'notes_id'
+);
+
+CREATE TRIGGER IF NOT EXISTS notes_fts_insert
+AFTER INSERT ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO NotesFTS(rowid, description) VALUES (NEW.notes_id, NEW.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS notes_fts_delete
+AFTER DELETE ON Notes
+FOR EACH ROW
+BEGIN
+    INSERT INTO NotesFTS(NotesFTS, rowid, description) VALUES ('delete', OLD.notes_id, OLD.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS notes_fts_update
+AFTER UPDATE OF description ON Notes
+FOR EACH ROW
+WHEN OLD.description IS NOT NEW.description
+BEGIN
+    INSERT INTO NotesFTS(NotesFTS, rowid, description) VALUES ('delete', OLD.notes_id, OLD.description);
+    INSERT INTO NotesFTS(rowid, description) VALUES (NEW.notes_id, NEW.description);
+END;
+
+-- backfill from existing notes
+INSERT INTO NotesFTS(NotesFTS) VALUES ('rebuild');
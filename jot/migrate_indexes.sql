@@ -0,0 +1,11 @@
+-- schema upgrade 2: indexes for the tree build, status filter and alias lookups
+
+CREATE INDEX IF NOT EXISTS nest_parent ON Nest (parent);
+CREATE INDEX IF NOT EXISTS nest_child ON Nest (child);
+CREATE INDEX IF NOT EXISTS notes_status ON Notes (status_id);
+
+-- aliases must be unique before the constraint can be added; the oldest note keeps it
+UPDATE Notes SET alias = NULL
+WHERE alias IS NOT NULL AND notes_id NOT IN (
+    SELECT min(notes_id) FROM Notes WHERE alias IS NOT NULL GROUP BY alias);
+CREATE UNIQUE INDEX IF NOT EXISTS notes_alias ON Notes (alias);
@@ -0,0 +1,5 @@
+-- schema upgrade 6: indexes that give each status's notes in due, priority and modified order
+
+CREATE INDEX IF NOT EXISTS notes_status_due ON Notes (status_id, due);
+CREATE INDEX IF NOT EXISTS notes_status_priority ON Notes (status_id, priority);
+CREATE INDEX IF NOT EXISTS notes_status_modified ON Notes (status_id, modified_at);
@@ -0,0 +1,37 @@
+-- schema upgrade 5: what the summary table shows of each description, so it never reads the full text
+
+ALTER TABLE Notes ADD COLUMN first_line text;
+ALTER TABLE Notes ADD COLUMN is_multiline integer;
+
+UPDATE Notes SET
+	first_line = CASE WHEN instr(substr(coalesce(description, ''), 1, 1000), char(10)) > 0
+		THEN substr(description, 1, instr(substr(description, 1, 1000), char(10)) - 1)
+		ELSE substr(coalesce(description, ''), 1, 1000) END,
+	is_multiline = instr(coalesce(description, ''), char(10)) > 0;
+
+-- first_line stops at the first newline or 1000 characters, wider than any note column.
+-- No length is kept: whether a note is cut is decided from first_line against the column width
+CREATE TRIGGER IF NOT EXISTS notes_summary_insert
+AFTER INSERT ON Notes
+FOR EACH ROW
+BEGIN
+    UPDATE Notes SET
+        first_line = CASE WHEN instr(substr(coalesce(NEW.description, ''), 1, 1000), char(10)) > 0
+            THEN substr(NEW.description, 1, instr(substr(NEW.description, 1, 1000), char(10)) - 1)
+            ELSE substr(coalesce(NEW.description, ''), 1, 1000) END,
+        is_multiline = instr(coalesce(NEW.description, ''), char(10)) > 0
+    WHERE notes_id = NEW.notes_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS notes_summary_update
+AFTER UPDATE OF description ON Notes
+FOR EACH ROW
+WHEN OLD.description IS NOT NEW.description
+BEGIN
+    UPDATE Notes SET
+        first_line = CASE WHEN instr(substr(coalesce(NEW.description, ''), 1, 1000), char(10)) > 0
+            THEN substr(NEW.description, 1, instr(substr(NEW.description, 1, 1000), char(10)) - 1)
+            ELSE substr(coalesce(NEW.description, ''), 1, 1000) END,
+        is_multiline = instr(coalesce(NEW.description, ''), char(10)) > 0
+    WHERE notes_id = NEW.notes_id;
+END;